@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+
+def convert_permission_strings(sender, **kwargs):
+    # Data migration for roles created before permission_mask existed: fold
+    # the comma separated pks into the bitset and clear the legacy column.
+    from .models import Role
+    from sirius.utils.perm import mask_from_pks
+    roles = Role.objects.exclude(permissions="")
+    for role in roles:
+        role.permission_mask |= mask_from_pks(role.permissions.strip(',').split(','))
+        role.permissions = ""
+    Role.objects.bulk_update(roles, ['permission_mask', 'permissions'])
 
 
 class AuthorizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authorization'
+
+    def ready(self):
+        from sirius.utils.perm import reload_catalog, invalidate_all_perms, invalidate_member_perms, invalidate_moved_team_perms, invalidate_role_perms
+        post_migrate.connect(convert_permission_strings, sender=self)
+        post_migrate.connect(reload_catalog, sender=self)
+        post_save.connect(reload_catalog, sender='authorization.Permission')
+        post_delete.connect(reload_catalog, sender='authorization.Permission')
+        post_migrate.connect(invalidate_all_perms, sender=self)
+        post_save.connect(invalidate_member_perms, sender='authorization.Membership')
+        post_delete.connect(invalidate_member_perms, sender='authorization.Membership')
+        post_save.connect(invalidate_role_perms, sender='authorization.Role')
+        post_save.connect(invalidate_moved_team_perms, sender='team.Team')
@@ -8,7 +8,7 @@ class RoleCreationForm(forms.ModelForm):
             'team_id': forms.HiddenInput(),
         }
         model = Role
-        fields = ('role_name', 'team_id')
+        fields = ('role_name', 'team_id', 'inherited')
 
     # def clean_team_id(self):
     #     team_id = self.cleaned_data.get('team_id')
@@ -21,3 +21,13 @@ class MembershipUpdationForm(forms.ModelForm):
     class Meta:
         model = Membership
         fields = ('user_id', 'role_id')
+
+
+class MembershipImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with email and role columns')
+
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if not file.name.lower().endswith('.csv'):
+            raise forms.ValidationError('Upload a .csv file')
+        return file
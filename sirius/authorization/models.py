@@ -2,11 +2,24 @@ from django.db import models
 from team.models import Team
 from django.contrib.auth import get_user_model
 
+class RoleQuerySet(models.QuerySet):
+    def granting(self, permission_pk):
+        bit = Permission.bit_for(permission_pk)
+        return self.annotate(granted_bit=models.F('permission_mask').bitand(bit)).filter(granted_bit=bit)
+
 class Role(models.Model):
     role_name = models.CharField(max_length=100)
     team_id = models.ForeignKey(Team, on_delete=models.CASCADE)
     role_description = models.CharField(max_length=100)
-    permissions = models.TextField(default="")
+    # Legacy comma separated permission pks, folded into permission_mask by
+    # the post_migrate hook in authorization.apps and left empty afterwards.
+    permissions = models.TextField(default="", blank=True)
+    permission_mask = models.BigIntegerField(default=0)
+    # Members holding an inherited role get its permissions in every
+    # descendant team as well (see sirius.utils.perm.resolve_perms).
+    inherited = models.BooleanField('Applies to sub-teams', default=False)
+
+    objects = RoleQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -26,6 +39,9 @@ class Membership(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     alumni = models.BooleanField(default=False)
     role_id = models.ForeignKey(Role, on_delete=models.CASCADE, default=1)
+    # Notices created after this are unread for the member (null: since they
+    # joined). Moved with .update() so it does not bump the team version.
+    notices_seen_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -59,5 +75,15 @@ class Permission(models.Model):
     action = models.CharField(max_length=1, choices= ACTION_CHOICES)
     relation = models.CharField(max_length=2, choices= RELATION_CHOICES)
 
+    # Every permission owns bit (pk - 1) of Role.permission_mask. The pks are
+    # pinned by the permissions fixture, so the bits are stable.
+    @staticmethod
+    def bit_for(pk):
+        return 1 << (int(pk) - 1)
+
+    @property
+    def bit(self):
+        return Permission.bit_for(self.pk)
+
     def __str__(self):
         return self.action + " " + self.relation
@@ -1,3 +1,149 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+
+from authorization.models import Membership, Permission, Role
+from sirius.utils.perm import get_catalog, has_perm, mask_from_pks, permission_stamp, pks_from_mask, reachable_teams, reload_catalog, resolve_perms, teams_with_perm
+from team.models import Team
+from team.utils import init_roles, MEMBER_PERMISSIONS
 
 # Create your tests here.
+class PermissionCatalogTests(TestCase):
+    fixtures = ['permissions']
+
+    def test_loaded_once(self):
+        get_catalog()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_catalog().pk_for('R', 'N'), 14)
+            self.assertEqual(get_catalog().codes[1], 'C-E')
+
+    def test_reloaded_when_permissions_change(self):
+        self.assertIsNone(get_catalog().pk_for('C', 'P'))
+        # The rollback at the end of the test sends no signal.
+        self.addCleanup(reload_catalog)
+        Permission.objects.create(pk=31, action='C', relation='P')
+        self.assertEqual(get_catalog().pk_for('C', 'P'), 31)
+        self.assertEqual(get_catalog().all_mask, (1 << 31) - 1)
+
+    def test_mask_bits_map_to_codes(self):
+        mask = mask_from_pks(MEMBER_PERMISSIONS)
+        self.assertEqual(mask, (1 << 5) | (1 << 20) | (1 << 13) | (1 << 1) | (1 << 17))
+        self.assertEqual(get_catalog().codes_for_mask(mask), {'R-T', 'R-M', 'R-N', 'R-E', 'R-C'})
+        self.assertEqual(pks_from_mask(mask), sorted(MEMBER_PERMISSIONS))
+
+class PermissionResolutionTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_user(email='admin@example.com', password='pw', username='admin')
+        self.member = User.objects.create_user(email='member@example.com', password='pw', username='member')
+        self.team = Team.objects.create(name='Team', description='')
+        init_roles(self.team, self.admin)
+        Membership.objects.create(user_id=self.member, team_id=self.team, role_id=Role.objects.get(team_id=self.team, role_name='Member'))
+
+    def test_member_holds_only_role_permissions(self):
+        self.assertTrue(has_perm('R', 'N', self.member, self.team.pk))
+        self.assertFalse(has_perm('C', 'N', self.member, self.team.pk))
+        self.assertTrue(has_perm('C', 'N', self.admin, self.team.pk))
+
+    def test_no_membership_no_permissions(self):
+        other = Team.objects.create(name='Other', description='')
+        self.assertEqual(resolve_perms(self.member, other.pk), frozenset())
+
+    def test_resolved_once_per_request_user(self):
+        resolve_perms(self.member, self.team.pk)
+        with self.assertNumQueries(0):
+            has_perm('R', 'N', self.member, self.team.pk)
+            has_perm('D', 'T', self.member, str(self.team.pk))
+
+    def test_perm_required_denies(self):
+        self.client.force_login(self.member)
+        response = self.client.get(reverse('team:join_requests', kwargs={'pk': self.team.pk}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_perm_required_allows(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('team:join_requests', kwargs={'pk': self.team.pk}))
+        self.assertEqual(response.status_code, 200)
+
+
+class InheritedRoleTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='pw', username='user')
+        self.root = Team.objects.create(name='Root', description='')
+        self.child = Team.objects.create(name='Child', description='', parent_id=self.root)
+        self.leaf = Team.objects.create(name='Leaf', description='', parent_id=self.child)
+        self.other = Team.objects.create(name='Other', description='')
+        # Reads notices (pk 14) from the root down, creates them (pk 13) in the child only.
+        self.reader = Role.objects.create(role_name='Reader', team_id=self.root, role_description='', permission_mask=mask_from_pks([14]), inherited=True)
+        writer = Role.objects.create(role_name='Writer', team_id=self.child, role_description='', permission_mask=mask_from_pks([13]))
+        Membership.objects.create(user_id=self.user, team_id=self.root, role_id=self.reader)
+        Membership.objects.create(user_id=self.user, team_id=self.child, role_id=writer)
+
+    def fresh_user(self):
+        # A new object per "request", so only the shared cache carries over.
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def team_ids(self, queryset):
+        return {row['team_id'] for row in queryset}
+
+    def test_inherited_role_reaches_descendants(self):
+        user = self.fresh_user()
+        self.assertTrue(has_perm('R', 'N', user, self.leaf.pk))
+        self.assertTrue(has_perm('C', 'N', user, self.child.pk))
+        self.assertFalse(has_perm('C', 'N', user, self.leaf.pk))
+        self.assertFalse(has_perm('R', 'N', user, self.other.pk))
+
+    def test_role_change_invalidates_cached_permissions(self):
+        self.assertTrue(has_perm('R', 'N', self.fresh_user(), self.leaf.pk))
+        self.reader.inherited = False
+        self.reader.save()
+        self.assertFalse(has_perm('R', 'N', self.fresh_user(), self.leaf.pk))
+        self.assertTrue(has_perm('R', 'N', self.fresh_user(), self.root.pk))
+
+    def test_moved_team_leaves_inherited_reach(self):
+        self.assertTrue(has_perm('R', 'N', self.fresh_user(), self.leaf.pk))
+        self.leaf.parent_id = self.other
+        self.leaf.save()
+        self.assertFalse(has_perm('R', 'N', self.fresh_user(), self.leaf.pk))
+
+    def test_teams_with_perm(self):
+        user = self.fresh_user()
+        self.assertEqual(self.team_ids(teams_with_perm('R', 'N', user)), {self.root.id, self.child.id, self.leaf.id})
+        self.assertEqual(self.team_ids(teams_with_perm('C', 'N', user)), {self.child.id})
+        self.assertEqual(self.team_ids(teams_with_perm('R', 'N', user, [self.leaf.id, self.other.id])), {self.leaf.id})
+        self.assertEqual(set(reachable_teams(user)), {self.root, self.child, self.leaf})
+
+    def test_deleted_teams_are_not_reached(self):
+        Team.objects.filter(pk=self.leaf.pk).update(deleted_at=timezone.now())
+        user = self.fresh_user()
+        self.assertEqual(self.team_ids(teams_with_perm('R', 'N', user)), {self.root.id, self.child.id})
+        self.assertFalse(has_perm('R', 'N', user, self.leaf.pk))
+
+    def test_unrelated_changes_keep_cached_permissions(self):
+        outsider = get_user_model().objects.create_user(email='outsider@example.com', password='pw', username='outsider')
+        Membership.objects.create(user_id=outsider, team_id=self.other, role_id=Role.objects.create(role_name='Guest', team_id=self.other, role_description=''))
+        before = permission_stamp(self.user)
+        team = Team.objects.create(name='New', description='')
+        init_roles(team, outsider)
+        self.leaf.name = 'Renamed leaf'
+        self.leaf.save()
+        Team.bump_version(self.root.pk)
+        self.assertEqual(permission_stamp(self.user), before)
+
+    def test_changes_move_only_affected_users(self):
+        outsider = get_user_model().objects.create_user(email='outsider@example.com', password='pw', username='outsider')
+        before = permission_stamp(self.user), permission_stamp(outsider)
+        self.reader.permission_mask |= mask_from_pks([13])
+        self.reader.save()
+        self.assertNotEqual(permission_stamp(self.user), before[0])
+        self.assertEqual(permission_stamp(outsider), before[1])
+        before = permission_stamp(self.user)
+        # A move out from under the inherited role.
+        self.leaf.parent_id = self.other
+        self.leaf.save()
+        self.assertNotEqual(permission_stamp(self.user), before)
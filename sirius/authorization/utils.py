@@ -0,0 +1,89 @@
+import csv
+import io
+from collections import defaultdict
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from team.models import Team
+from sirius.utils.fragments import invalidate_team_fragments
+from sirius.utils.perm import invalidate_team_perms
+from .models import Membership, Role
+
+# Set-based membership changes. Rows are moved with UPDATE ... WHERE pk IN
+# statements, one per target role, so the per-row post_save handlers do not
+# run; the team's version and fragments are moved once at the end instead.
+
+EXPORT_FIELDS = ('email', 'role')
+
+
+def _touch_team(team_pk):
+    Team.bump_version(team_pk)
+    invalidate_team_fragments(team_pk)
+    invalidate_team_perms(team_pk)
+
+
+def assign_roles(team_pk, assignments):
+    # {membership pk: role pk} for members of the team; pairs naming another
+    # team's membership or role are ignored. Returns the number of rows moved.
+    roles = set(Role.objects.filter(team_id=team_pk, pk__in=set(assignments.values())).values_list('pk', flat=True))
+    by_role = defaultdict(list)
+    for membership, role in assignments.items():
+        if int(role) in roles:
+            by_role[int(role)].append(membership)
+    updated = 0
+    with transaction.atomic():
+        for role, memberships in by_role.items():
+            updated += Membership.objects.filter(team_id=team_pk, pk__in=memberships).exclude(role_id=role).update(role_id=role, updated_at=timezone.now())
+    if updated:
+        _touch_team(team_pk)
+    return updated
+
+
+def reassign_role(team_pk, from_role, to_role):
+    updated = Membership.objects.filter(team_id=team_pk, role_id=from_role).update(role_id=to_role, updated_at=timezone.now())
+    if updated:
+        _touch_team(team_pk)
+    return updated
+
+
+def export_memberships(team_pk):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_FIELDS)
+    writer.writerows(Membership.objects.filter(team_id=team_pk).order_by('user_id__email').values_list('user_id__email', 'role_id__role_name'))
+    return out.getvalue()
+
+
+def import_memberships(team_pk, text):
+    # Sets the role of every member listed in an (email, role) CSV. Users,
+    # roles and memberships are each read with one query. Returns
+    # (updated, [(line, email, outcome)]).
+    reader = csv.DictReader(io.StringIO(text))
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    if any(field not in reader.fieldnames for field in EXPORT_FIELDS):
+        raise ValueError('CSV must have email and role columns')
+    rows = [(line, (record['email'] or '').strip(), (record['role'] or '').strip()) for line, record in enumerate(reader, start=2)]
+    users = dict(
+        get_user_model().objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in={email.lower() for _, email, _ in rows}).values_list('email_lower', 'pk')
+    )
+    roles = {name.lower(): pk for name, pk in Role.objects.filter(team_id=team_pk).values_list('role_name', 'pk')}
+    members = dict(Membership.objects.filter(team_id=team_pk, user_id__in=users.values()).values_list('user_id', 'pk'))
+    assignments, results, seen = {}, [], set()
+    for line, email, role in rows:
+        user = users.get(email.lower())
+        if email.lower() in seen:
+            outcome = 'Duplicate in file'
+        elif user is None:
+            outcome = 'No user with this email'
+        elif user not in members:
+            outcome = 'Not a member'
+        elif role.lower() not in roles:
+            outcome = f'No role named "{role}"'
+        else:
+            assignments[members[user]] = roles[role.lower()]
+            outcome = 'Updated'
+        seen.add(email.lower())
+        results.append((line, email, outcome))
+    return assign_roles(team_pk, assignments), results
@@ -1,12 +1,14 @@
+import csv
 from django.shortcuts import render,redirect
-from .forms import RoleCreationForm
+from .forms import RoleCreationForm, MembershipImportForm
 from django.contrib.auth.decorators import login_required
 from .models import Role
 from authorization.models import Membership, Permission
 from team.models import Team
-from sirius.utils.perm import has_perm, display_perms
+from sirius.utils.perm import has_perm, display_perms, perm_required, mask_from_pks, get_catalog
 from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseBadRequest
 from sirius.utils.console_context import get_console_data
+from .utils import assign_roles, reassign_role, export_memberships, import_memberships
 
 @login_required(login_url='user:signin')
 def create_role(request, team_pk):
@@ -24,7 +26,7 @@ def create_role(request, team_pk):
 @login_required(login_url='user:signin')
 def show_roles(request, team_pk):
     members = Membership.objects.filter(team_id=team_pk).values('pk', 'user_id__pk', 'user_id__first_name', 'user_id__last_name', 'user_id__email', 'role_id__role_name', 'role_id__role_description', 'role_id__pk')
-    roles = Role.objects.filter(team_id=team_pk).values('pk', 'role_name', 'role_description')
+    roles = Role.objects.filter(team_id=team_pk).values('pk', 'role_name', 'role_description', 'inherited')
     role_form = RoleCreationForm()
     create_role_errors = request.session.get('create_role_errors')
     if create_role_errors:
@@ -44,22 +46,40 @@ def update_roles(request, team_pk):
     if request.method == 'POST':
         if not has_perm('U', 'R', request.user, team_pk):
             return HttpResponseForbidden()
-        for key, role_id in request.POST.items():
-            if key.startswith('role-'):
-                member_pk = key.split('-')[1]
-                membership = Membership.objects.get(pk=member_pk)
-                membership.role_id = Role.objects.get(pk=role_id)
-                membership.save()
+        assign_roles(team_pk, {key.split('-')[1]: role_id for key, role_id in request.POST.items() if key.startswith('role-') and role_id.isnumeric()})
         return redirect('authorization:show_roles', team_pk=team_pk)
     return Http404()
 
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'M'), ('R', 'R'), team_kwarg='team_pk')
+def export_roles(request, team_pk):
+    response = HttpResponse(export_memberships(team_pk), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="members-{team_pk}.csv"'
+    return response
+
+
+@login_required(login_url='user:signin')
+@perm_required(('U', 'R'), team_kwarg='team_pk')
+def import_roles(request, team_pk):
+    updated, results = None, []
+    if request.method == 'POST':
+        form = MembershipImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                updated, results = import_memberships(team_pk, form.cleaned_data['file'].read().decode('utf-8-sig'))
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                form.add_error('file', f'Could not read file: {e}')
+    else:
+        form = MembershipImportForm()
+    return render(request, 'import_roles.html', {'form': form, 'updated': updated, 'results': results, 'console': get_console_data(team_pk, request.user)})
+
+
+@login_required(login_url='user:signin')
+@perm_required(('R', 'R'), team_kwarg='team_pk')
 def show_permissions(request, team_pk):
-    if not has_perm('R', 'R', request.user, team_pk):
-        return HttpResponseForbidden()
-    roles = Role.objects.filter(team_id__id=team_pk).values('pk', 'role_name', 'role_description', 'permissions')
-    all_permissions = Permission.objects.all()
+    roles = Role.objects.filter(team_id__id=team_pk).values('pk', 'role_name', 'role_description', 'permission_mask')
+    all_permissions = get_catalog().permissions
     return render(request, 'show_permissions.html', {
         'console': get_console_data(team_pk, request.user),
         'roles': roles,
@@ -81,15 +101,15 @@ def update_permissions(request, team_pk):
             return HttpResponseBadRequest('Invalid request')
         if str(role.team_id.id) != str(team_pk):
             return HttpResponseBadRequest('Invalid request')
-        role.permissions = perm_string
+        role.permission_mask = mask_from_pks(perm_string.strip(',').split(','))
+        role.permissions = ""
         role.save()
         return redirect('authorization:show_permissions', team_pk=team_pk)
     return Http404()
 
 @login_required(login_url='user:signin')
+@perm_required(('D', 'R'), team_kwarg='team_pk')
 def delete_role(request, team_pk, r_pk):
-    if not has_perm('D', 'R', request.user, team_pk):
-        return HttpResponseForbidden()
     role = Role.objects.get(pk=r_pk)
     if str(role.team_id.id) != str(team_pk):
         return HttpResponseBadRequest('Invalid request')
@@ -97,11 +117,8 @@ def delete_role(request, team_pk, r_pk):
         return HttpResponseBadRequest('Invalid request')
     if role.role_name == "Admin" or role.role_name == "Member":
         return HttpResponseBadRequest(f'Cannot delete {role.role_name} role')
-    curr_members = Membership.objects.filter(team_id__id=team_pk).filter(role_id__pk=r_pk)
     member_role = Role.objects.get(team_id__id=team_pk, role_name = "Member")
-    for member in curr_members:
-        member.role_id = member_role
-        member.save()
+    reassign_role(team_pk, r_pk, member_role.pk)
     role.delete()
     return redirect('authorization:show_roles', team_pk=team_pk)
 
@@ -1,6 +1,50 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+
+def fill_class_minutes(sender, **kwargs):
+    # Backfills the minute columns of classes created before they existed;
+    # a real class always ends after minute 0.
+    from django.db import connection
+    from .models import Class, to_minutes
+    if Class._meta.db_table not in connection.introspection.table_names():
+        # Migrated back to zero (see the flatten_sessions command).
+        return
+    classes = list(Class.objects.filter(end_minute=0))
+    for class_ in classes:
+        class_.start_minute = to_minutes(class_.start_time)
+        class_.end_minute = to_minutes(class_.end_time)
+    Class.objects.bulk_update(classes, ['start_minute', 'end_minute'], batch_size=500)
+
+
+def fill_series_end(sender=None, **kwargs):
+    # One-off events saved before recurrence existed end with their only
+    # occurrence; a null series_end would mark them as never ending.
+    from django.db.models import F
+    from .models import Event
+    Event.objects.filter(frequency='', series_end__isnull=True).update(series_end=F('end'))
+
+
+def invalidate_fragments(sender, instance, **kwargs):
+    from sirius.utils.fragments import invalidate_team_fragments
+    invalidate_team_fragments(instance.team_id_id)
 
 
 class SessionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'session'
+
+    def ready(self):
+        from .search import create_index, index_session, unindex_session
+        from .stream import publish_session
+        post_migrate.connect(fill_class_minutes, sender=self)
+        post_migrate.connect(fill_series_end, sender=self)
+        for model in ('session.Class', 'session.Event', 'session.Notice'):
+            post_save.connect(invalidate_fragments, sender=model)
+            post_delete.connect(invalidate_fragments, sender=model)
+        post_migrate.connect(create_index, sender=self)
+        for model in ('session.Event', 'session.Notice'):
+            post_save.connect(index_session, sender=model)
+            post_delete.connect(unindex_session, sender=model)
+            post_save.connect(publish_session, sender=model)
+            post_delete.connect(publish_session, sender=model)
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Class, Notice, Event
+from .recurrence import MAX_COUNT, parse_exdates
 
 
 class ClassCreationForm(forms.ModelForm):
@@ -23,9 +24,8 @@ class ClassCreationForm(forms.ModelForm):
             if start_time >= end_time:
                 raise forms.ValidationError('Invalid time range')
             
-            for _class in Class.objects.filter(day=day, team_id=team_id):
-                if not (start_time >= _class.end_time or end_time <= _class.end_time):
-                    raise forms.ValidationError('Class overlaps with another class')
+            if Class.objects.overlapping(team_id, day, start_time, end_time).exclude(pk=self.instance.pk).exists():
+                raise forms.ValidationError('Class overlaps with another class')
         else:
             raise forms.ValidationError('Some fields are missing')
 
@@ -49,22 +49,47 @@ class ClassUpdationForm(forms.ModelForm):
             if start_time >= end_time:
                 raise forms.ValidationError('Invalid time range')
             
-            for _class in Class.objects.filter(day=day, team_id=team_id):
-                if not (start_time >= _class.end_time or end_time <= _class.end_time):
-                    raise forms.ValidationError('Class overlaps with another class')
+            if Class.objects.overlapping(team_id, day, start_time, end_time).exclude(pk=self.instance.pk).exists():
+                raise forms.ValidationError('Class overlaps with another class')
         else:
             raise forms.ValidationError('Some fields are missing')
 
 
+EVENT_FIELDS = ('start', 'end', 'title', 'description', 'frequency', 'interval', 'repeat_until', 'repeat_count', 'exdates')
+EVENT_WIDGETS = {
+    'start': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+    'end': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+    'repeat_until': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+    'exdates': forms.TextInput(attrs={'placeholder': '2022-05-02, 2022-05-09'}),
+}
+
+
+def check_recurrence(cleaned_data):
+    start = cleaned_data.get('start')
+    repeat_until = cleaned_data.get('repeat_until')
+    repeat_count = cleaned_data.get('repeat_count')
+    if not cleaned_data.get('frequency'):
+        return
+    if not cleaned_data.get('interval'):
+        raise forms.ValidationError('Repeat interval must be at least 1')
+    if repeat_until and repeat_count:
+        raise forms.ValidationError('Give either an end date or a number of occurrences, not both')
+    if repeat_count and repeat_count > MAX_COUNT:
+        raise forms.ValidationError(f'An event can repeat at most {MAX_COUNT} times')
+    if repeat_until and start and repeat_until < start:
+        raise forms.ValidationError('Repetition ends before the event starts')
+    try:
+        parse_exdates(cleaned_data.get('exdates'))
+    except ValueError as e:
+        raise forms.ValidationError(f'Invalid dates to skip: {e}')
+
+
 class CalendarCreationForm(forms.ModelForm):
 
     class Meta:
         model = Event
-        fields = ('start', 'end', 'title', 'description')
-        widgets = {
-            'start': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
-            'end': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
-        }
+        fields = EVENT_FIELDS
+        widgets = EVENT_WIDGETS
 
     def clean(self):
         start = self.cleaned_data.get('start')
@@ -76,17 +101,15 @@ class CalendarCreationForm(forms.ModelForm):
                 raise forms.ValidationError('Event already exists')
             if start >= end:
                 raise forms.ValidationError('Invalid time range')
+            check_recurrence(self.cleaned_data)
         else:
             raise forms.ValidationError('Some fields are missing')
 
 class CalendarUpdationForm(forms.ModelForm):
     class Meta:
         model = Event
-        fields = ('start', 'end', 'title', 'description')
-        widgets = {
-            'start': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
-            'end': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
-        }
+        fields = EVENT_FIELDS
+        widgets = EVENT_WIDGETS
 
     def clean(self):
         start = self.cleaned_data.get('start')
@@ -97,12 +120,16 @@ class CalendarUpdationForm(forms.ModelForm):
             raise forms.ValidationError('Some fields are missing')
         if start >= end:
             raise forms.ValidationError('Invalid time range')
+        check_recurrence(self.cleaned_data)
         
 
 class NoticeCreationForm(forms.ModelForm):
     class Meta:
         model = Notice
-        fields = ('title', 'description')
+        fields = ('title', 'description', 'pinned', 'expires_at')
+        widgets = {
+            'expires_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
         
     def clean_title(self):
         title = self.cleaned_data.get('title')
@@ -113,7 +140,10 @@ class NoticeCreationForm(forms.ModelForm):
 class NoticeUpdationForm(forms.ModelForm):
     class Meta:
         model = Notice
-        fields = ('title', 'description')
+        fields = ('title', 'description', 'pinned', 'expires_at')
+        widgets = {
+            'expires_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
 
     def clean_title(self):
         title = self.cleaned_data.get('title')
@@ -121,5 +151,11 @@ class NoticeUpdationForm(forms.ModelForm):
             raise forms.ValidationError('Title of the notice is required')
         return title
 
+class TimetableImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV or JSON with title, day, start_time, end_time and description')
 
-
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if not file.name.lower().endswith(('.csv', '.json')):
+            raise forms.ValidationError('Upload a .csv or .json file')
+        return file
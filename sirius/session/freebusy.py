@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from django.db.models import Min
+from authorization.models import Membership
+from .models import Class, Event
+from .utils import events_in_window
+
+# Common free time of a team's members. A member is busy during the classes
+# and events of every team they belong to, so the union of everyone's busy
+# time is the union over the distinct teams of all members: the member count
+# only changes the size of one subquery. Busy time is merged as sorted
+# minute intervals relative to the start of the range.
+
+
+def member_teams(team_id):
+    members = Membership.objects.filter(team_id=team_id).values('user_id')
+    return Membership.objects.filter(user_id__in=members, team_id__deleted_at__isnull=True).values('team_id').distinct()
+
+
+def _minutes(value, start, ceil=False):
+    seconds = (value - start).total_seconds()
+    return int(-(-seconds // 60) if ceil else seconds // 60)
+
+
+def busy_intervals(teams, start, end, day_start=None, day_end=None):
+    intervals = []
+    # Identical slots in different teams are fetched once.
+    slots = {}
+    classes = Class.objects.filter(team_id__in=teams).values('day', 'start_minute', 'end_minute').annotate(since=Min('created_at'))
+    for slot in classes:
+        slots.setdefault(int(slot['day']), []).append(slot)
+    day = datetime.combine(start.date(), datetime.min.time())
+    while day < end:
+        offset = _minutes(day, start)
+        for slot in slots.get(day.weekday(), ()):
+            if slot['since'].date() <= day.date():
+                intervals.append((offset + slot['start_minute'], offset + slot['end_minute']))
+        # Outside the requested hours counts as busy.
+        if day_start is not None:
+            intervals.append((offset, offset + day_start))
+        if day_end is not None:
+            intervals.append((offset + day_end, offset + 24 * 60))
+        day += timedelta(days=1)
+    for event in events_in_window(Event.objects.filter(team_id__in=teams), start, end):
+        intervals.append((_minutes(event['start'], start), _minutes(event['end'], start, ceil=True)))
+    return intervals
+
+
+def merge(intervals, length):
+    # Sorted, non-overlapping busy intervals clipped to [0, length).
+    merged = []
+    for begin, finish in sorted(intervals):
+        begin, finish = max(begin, 0), min(finish, length)
+        if begin >= finish:
+            continue
+        if merged and begin <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], finish)
+        else:
+            merged.append([begin, finish])
+    return merged
+
+
+def free_slots(team_id, start, end, duration, day_start=None, day_end=None):
+    # (start, end) datetimes of the gaps of at least `duration` minutes.
+    length = _minutes(end, start)
+    busy = merge(busy_intervals(member_teams(team_id), start, end, day_start, day_end), length)
+    free, cursor = [], 0
+    for begin, finish in busy + [[length, length]]:
+        if begin - cursor >= duration:
+            free.append((start + timedelta(minutes=cursor), start + timedelta(minutes=begin)))
+        cursor = max(cursor, finish)
+    return free
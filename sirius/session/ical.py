@@ -0,0 +1,122 @@
+import datetime
+from hashlib import md5
+from django.core import signing
+from django.utils import timezone
+from sirius.utils.conditional import teams_state
+from .recurrence import RRULE_FREQUENCIES, SERIES_FIELDS, parse_exdates
+
+FEED_SALT = 'session.calendar-feed'
+# Rows fetched per round trip while streaming a feed.
+FEED_CHUNK_SIZE = 500
+
+
+def feed_token(user, team=None):
+    # Signed "<user pk>:<team id>:<feed generation>" (team id empty for a
+    # personal feed). The feed is rendered with that user's permissions at
+    # request time, so no session is needed, and bumping the user's
+    # feed_generation revokes every link handed out before.
+    return signing.Signer(salt=FEED_SALT).sign(f'{user.pk}:{team or ""}:{user.feed_generation}')
+
+
+def read_feed_token(token, team=None):
+    # (user pk, feed generation), or None for a forged or foreign token.
+    try:
+        user_pk, token_team, generation = signing.Signer(salt=FEED_SALT).unsign(token).split(':')
+    except (signing.BadSignature, ValueError):
+        return None
+    if token_team != str(team or ''):
+        return None
+    return user_pk, generation
+
+
+def feed_state(teams, query=''):
+    # (etag, last_modified) for conditional GET, from the content versions of
+    # the teams in the feed; the query string (?classes=1) is part of the tag.
+    state = teams_state(teams)
+    etag = f'{state["teams"]}-{state["version"]}-{md5(query.encode()).hexdigest()[:8]}'
+    return etag, state['last']
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line):
+    # RFC 5545 lines are at most 75 octets; continuations start with a space.
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, limit = [], 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded, limit = encoded[cut:], 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _stamp(value):
+    # UTC with the "Z" suffix; stored times are naive in settings.TIME_ZONE.
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _rrule_lines(event):
+    # Recurring series are published as one VEVENT with RRULE/EXDATE, so the
+    # feed stays one entry per series and clients expand it themselves.
+    if not event['frequency']:
+        return []
+    rule = f'RRULE:FREQ={RRULE_FREQUENCIES[event["frequency"]]};INTERVAL={event["interval"]}'
+    if event['repeat_count']:
+        rule += f';COUNT={event["repeat_count"]}'
+    elif event['repeat_until']:
+        rule += f';UNTIL={_stamp(event["repeat_until"])}'
+    start = event['start'].time()
+    return [rule] + [f'EXDATE:{_stamp(datetime.datetime.combine(date, start))}' for date in sorted(parse_exdates(event['exdates']))]
+
+
+def _event_block(event):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event["pk"]}@sirius',
+        f'DTSTAMP:{_stamp(event["updated_at"])}',
+        f'DTSTART:{_stamp(event["start"])}',
+        f'DTEND:{_stamp(event["end"])}',
+    ] + _rrule_lines(event) + [
+        f'SUMMARY:{_escape(event["title"])}',
+        f'DESCRIPTION:{_escape(event["description"])}',
+        'END:VEVENT',
+    ]
+    return ''.join(_fold(line) for line in lines)
+
+
+def _class_block(class_):
+    # Weekly slot anchored on the first matching weekday after creation.
+    created = class_['created_at'].date()
+    first = created + datetime.timedelta(days=(int(class_['day']) - created.weekday()) % 7)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:class-{class_["pk"]}@sirius',
+        f'DTSTAMP:{_stamp(class_["updated_at"])}',
+        f'DTSTART:{_stamp(datetime.datetime.combine(first, class_["start_time"]))}',
+        f'DTEND:{_stamp(datetime.datetime.combine(first, class_["end_time"]))}',
+        'RRULE:FREQ=WEEKLY',
+        f'SUMMARY:{_escape(class_["title"])}',
+        f'DESCRIPTION:{_escape(class_["description"])}',
+        'END:VEVENT',
+    ]
+    return ''.join(_fold(line) for line in lines)
+
+
+def stream_calendar(name, events, classes=None):
+    # Generator for StreamingHttpResponse; querysets are walked with
+    # .iterator() so memory stays flat however large the feed is.
+    yield _fold('BEGIN:VCALENDAR') + _fold('VERSION:2.0') + _fold('PRODID:-//Sirius//Calendar//EN') + _fold(f'X-WR-CALNAME:{_escape(name)}')
+    for event in events.values('pk', 'title', 'description', 'updated_at', *SERIES_FIELDS).iterator(chunk_size=FEED_CHUNK_SIZE):
+        yield _event_block(event)
+    if classes is not None:
+        for class_ in classes.values('pk', 'title', 'description', 'day', 'start_time', 'end_time', 'created_at', 'updated_at').iterator(chunk_size=FEED_CHUNK_SIZE):
+            yield _class_block(class_)
+    yield _fold('END:VCALENDAR')
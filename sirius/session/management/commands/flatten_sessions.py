@@ -0,0 +1,90 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from session.apps import fill_series_end
+from session.models import Class, Notice, Event
+from session.search import create_index
+
+# Moves sessions stored in the old multi-table layout (a shared session_session
+# row plus one child row per session) to one table per session type:
+#
+#   python manage.py flatten_sessions export sessions.json   # old schema
+#   cp sessions.json <somewhere safe>                         # see below
+#   python manage.py migrate session zero                     # drop the old tables
+#   rm session/migrations/0*.py                               # old layout's migrations
+#   python manage.py makemigrations session && python manage.py migrate
+#   python manage.py flatten_sessions import sessions.json   # new schema
+#
+# Once "migrate session zero" has dropped the tables, the exported file is
+# the only copy of the sessions: keep a backup of it (and of the database)
+# until the import has succeeded. The old migration files must be deleted
+# before makemigrations, or it writes an alteration of the old parent-table
+# layout instead of creating the flat tables.
+# Primary keys are kept, so existing links to /class/<pk>/ etc. stay valid.
+
+SHARED_COLUMNS = ('title', 'created_at', 'updated_at', 'team_id_id', 'description')
+LAYOUT = {
+    'class': (Class, ('start_time', 'end_time', 'day', 'start_minute', 'end_minute')),
+    'notice': (Notice, ('user_id_id', 'pinned', 'expires_at')),
+    'event': (Event, ('start', 'end')),
+}
+
+
+class Command(BaseCommand):
+    help = 'Export sessions from the old multi-table layout, or import them into the flat one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('export', 'import'))
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'export':
+            self.export(options['path'])
+        else:
+            self.load(options['path'])
+
+    def export(self, path):
+        tables = connection.introspection.table_names()
+        if 'session_session' not in tables:
+            raise CommandError('session_session does not exist; nothing to export.')
+        data = {}
+        with connection.cursor() as cursor:
+            for name, (model, columns) in LAYOUT.items():
+                if f'session_{name}' not in tables:
+                    data[name] = []
+                    continue
+                select = ', '.join([f's.{connection.ops.quote_name(c)}' for c in SHARED_COLUMNS] + [f'c.{connection.ops.quote_name(c)}' for c in columns])
+                cursor.execute(f'SELECT s.id, {select} FROM session_session s JOIN session_{name} c ON c.session_ptr_id = s.id ORDER BY s.id')
+                data[name] = [dict(zip(('id',) + SHARED_COLUMNS + columns, row)) for row in cursor.fetchall()]
+        with open(path, 'w') as f:
+            json.dump(data, f, cls=DjangoJSONEncoder)
+        self.stdout.write(', '.join(f'{len(rows)} {name}' for name, rows in data.items()) + f' exported to {path}')
+        self.stdout.write(self.style.WARNING(f'{path} is the only copy of the sessions once "migrate session zero" has run; back it up first.'))
+
+    def load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        with transaction.atomic():
+            for name, (model, columns) in LAYOUT.items():
+                rows = data.get(name, [])
+                fields = {f.attname: f for f in model._meta.concrete_fields}
+                objects = [model(**{column: fields[column].to_python(value) for column, value in row.items()}) for row in rows]
+                # Keep the exported timestamps instead of stamping "now".
+                stamps = [f for f in fields.values() if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+                saved = [(f, f.auto_now, f.auto_now_add) for f in stamps]
+                for f in stamps:
+                    f.auto_now = f.auto_now_add = False
+                try:
+                    model.objects.bulk_create(objects, batch_size=500)
+                finally:
+                    for f, auto_now, auto_now_add in saved:
+                        f.auto_now, f.auto_now_add = auto_now, auto_now_add
+                self.stdout.write(f'{len(objects)} {name} imported')
+            fill_series_end()
+            # bulk_create sends no signals, so the search index is rebuilt.
+            create_index(rebuild=True)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [model for model, _ in LAYOUT.values()]):
+                    cursor.execute(sql)
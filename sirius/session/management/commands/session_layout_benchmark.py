@@ -0,0 +1,127 @@
+import datetime
+import random
+import sqlite3
+import time
+from django.core.management.base import BaseCommand
+
+# Builds the old multi-table session layout and the flat one side by side in
+# an in-memory SQLite database, fills both with the same synthetic rows and
+# prints the query plan and timing of the hot session queries on each.
+
+MTI_SCHEMA = '''
+CREATE TABLE session_session (id integer PRIMARY KEY AUTOINCREMENT, title varchar(200), created_at datetime, updated_at datetime, team_id_id char(32), description text);
+CREATE INDEX session_session_team ON session_session (team_id_id);
+CREATE INDEX session_team_created_idx ON session_session (team_id_id, created_at);
+CREATE TABLE session_class (session_ptr_id integer PRIMARY KEY REFERENCES session_session (id), start_time time, end_time time, day varchar(1), start_minute smallint, end_minute smallint);
+CREATE INDEX class_day_minutes_idx ON session_class (day, start_minute, end_minute);
+CREATE TABLE session_notice (session_ptr_id integer PRIMARY KEY REFERENCES session_session (id), user_id_id integer, pinned bool, expires_at datetime);
+CREATE TABLE session_event (session_ptr_id integer PRIMARY KEY REFERENCES session_session (id), start datetime, "end" datetime);
+CREATE INDEX event_window_idx ON session_event (start, "end");
+'''
+
+FLAT_SCHEMA = '''
+CREATE TABLE session_class (id integer PRIMARY KEY AUTOINCREMENT, title varchar(200), created_at datetime, updated_at datetime, team_id_id char(32), description text, start_time time, end_time time, day varchar(1), start_minute smallint, end_minute smallint);
+CREATE INDEX session_class_team ON session_class (team_id_id);
+CREATE INDEX class_team_created_idx ON session_class (team_id_id, created_at);
+CREATE INDEX class_team_day_minutes_idx ON session_class (team_id_id, day, start_minute, end_minute);
+CREATE TABLE session_notice (id integer PRIMARY KEY AUTOINCREMENT, title varchar(200), created_at datetime, updated_at datetime, team_id_id char(32), description text, user_id_id integer, pinned bool, expires_at datetime);
+CREATE INDEX session_notice_team ON session_notice (team_id_id);
+CREATE INDEX notice_team_created_idx ON session_notice (team_id_id, created_at);
+CREATE TABLE session_event (id integer PRIMARY KEY AUTOINCREMENT, title varchar(200), created_at datetime, updated_at datetime, team_id_id char(32), description text, start datetime, "end" datetime);
+CREATE INDEX session_event_team ON session_event (team_id_id);
+CREATE INDEX event_team_created_idx ON session_event (team_id_id, created_at);
+CREATE INDEX event_team_window_idx ON session_event (team_id_id, start, "end");
+'''
+
+# (name, old layout SQL, flat layout SQL); parameters are filled in by _params.
+QUERIES = (
+    (
+        'timetable',
+        'SELECT s.id, s.title, c.day, c.start_time, c.end_time FROM session_class c JOIN session_session s ON s.id = c.session_ptr_id WHERE s.team_id_id = ? ORDER BY c.day, c.start_minute',
+        'SELECT id, title, day, start_time, end_time FROM session_class WHERE team_id_id = ? ORDER BY day, start_minute',
+    ),
+    (
+        'class overlap',
+        'SELECT 1 FROM session_class c JOIN session_session s ON s.id = c.session_ptr_id WHERE s.team_id_id = ? AND c.day = ? AND c.start_minute < ? AND c.end_minute > ? LIMIT 1',
+        'SELECT 1 FROM session_class WHERE team_id_id = ? AND day = ? AND start_minute < ? AND end_minute > ? LIMIT 1',
+    ),
+    (
+        'notice board',
+        'SELECT s.id, s.title, s.created_at FROM session_notice n JOIN session_session s ON s.id = n.session_ptr_id WHERE s.team_id_id = ? ORDER BY s.created_at DESC LIMIT 100',
+        'SELECT id, title, created_at FROM session_notice WHERE team_id_id = ? ORDER BY created_at DESC LIMIT 100',
+    ),
+    (
+        'calendar window',
+        'SELECT s.id, s.title, e.start, e."end" FROM session_event e JOIN session_session s ON s.id = e.session_ptr_id WHERE s.team_id_id = ? AND e.start < ? AND e."end" > ?',
+        'SELECT id, title, start, "end" FROM session_event WHERE team_id_id = ? AND start < ? AND "end" > ?',
+    ),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare query plans and timings of the multi-table and flat session layouts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=200)
+        parser.add_argument('--per-team', type=int, default=100, help='Rows of each session type per team.')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rows = self.generate(options['teams'], options['per_team'])
+        old = self.build(MTI_SCHEMA, rows, flat=False)
+        flat = self.build(FLAT_SCHEMA, rows, flat=True)
+        team = rows['teams'][len(rows['teams']) // 2]
+        for name, old_sql, flat_sql in QUERIES:
+            params = self.params(name, team)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, db, sql in (('multi-table', old, old_sql), ('flat', flat, flat_sql)):
+                plan = db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    db.execute(sql, params).fetchall()
+                elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+                self.stdout.write(f'  {label}: {elapsed:.3f} ms/query')
+                for step in plan:
+                    self.stdout.write(f'    {step[-1]}')
+
+    def params(self, name, team):
+        if name == 'class overlap':
+            return (team, '2', 11 * 60, 10 * 60)
+        if name == 'calendar window':
+            return (team, '2022-03-01 00:00:00', '2022-02-01 00:00:00')
+        return (team,)
+
+    def generate(self, teams, per_team):
+        random.seed(0)
+        teams = ['%032x' % random.getrandbits(128) for _ in range(teams)]
+        base = datetime.datetime(2022, 1, 1)
+        sessions = []
+        for team in teams:
+            for i in range(per_team):
+                created = base + datetime.timedelta(minutes=random.randrange(525600))
+                start_minute = random.randrange(8 * 60, 17 * 60)
+                start = base + datetime.timedelta(hours=random.randrange(8760))
+                sessions.append(('class', team, created, (f'{start_minute // 60:02}:{start_minute % 60:02}', f'{(start_minute + 60) // 60:02}:{start_minute % 60:02}', str(i % 7), start_minute, start_minute + 60)))
+                sessions.append(('notice', team, created, (1, False, None)))
+                sessions.append(('event', team, created, (str(start), str(start + datetime.timedelta(hours=2)))))
+        random.shuffle(sessions)
+        return {'teams': teams, 'sessions': sessions}
+
+    def build(self, schema, rows, flat):
+        db = sqlite3.connect(':memory:')
+        db.executescript(schema)
+        columns = {
+            'class': 'start_time, end_time, day, start_minute, end_minute',
+            'notice': 'user_id_id, pinned, expires_at',
+            'event': 'start, "end"',
+        }
+        for pk, (kind, team, created, extra) in enumerate(rows['sessions'], 1):
+            shared = (pk, f'{kind} {pk}', str(created), str(created), team, '')
+            marks = ', '.join('?' * (len(shared) + len(extra)))
+            if flat:
+                db.execute(f'INSERT INTO session_{kind} (id, title, created_at, updated_at, team_id_id, description, {columns[kind]}) VALUES ({marks})', shared + extra)
+            else:
+                db.execute('INSERT INTO session_session (id, title, created_at, updated_at, team_id_id, description) VALUES (?, ?, ?, ?, ?, ?)', shared)
+                db.execute(f'INSERT INTO session_{kind} (session_ptr_id, {columns[kind]}) VALUES ({", ".join("?" * (1 + len(extra)))})', (pk,) + extra)
+        db.execute('ANALYZE')
+        return db
@@ -1,19 +1,41 @@
 from django.db import models
+from django.utils import timezone
 
 from team.models import Team
+from . import recurrence
 from django.contrib.auth import get_user_model
-import datetime
 
 # Create your models here.
+# Abstract, so every session type lives in a single table of its own; list
+# and time-range queries never join a shared parent table.
 class Session(models.Model):
     title = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     team_id = models.ForeignKey(Team, on_delete=models.CASCADE)
     description = models.TextField(blank=True, null=True)
+
+    class Meta:
+        abstract = True
+        indexes = [
+            models.Index(fields=['team_id', 'created_at'], name='%(class)s_team_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+class ClassQuerySet(models.QuerySet):
+    def overlapping(self, team_id, day, start_time, end_time):
+        return self.filter(
+            team_id=team_id,
+            day=day,
+            start_minute__lt=to_minutes(end_time),
+            end_minute__gt=to_minutes(start_time),
+        )
+
 class Class(Session):
     DAYS_OF_WEEK = (
         ('0', 'Monday'),
@@ -27,34 +49,76 @@ class Class(Session):
     start_time = models.TimeField()
     end_time = models.TimeField()
     day = models.CharField(max_length=1, choices=DAYS_OF_WEEK)
+    # Minutes since midnight, derived from start_time/end_time on save so that
+    # overlap checks are plain integer comparisons in SQL.
+    start_minute = models.PositiveSmallIntegerField(default=0, editable=False)
+    end_minute = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = ClassQuerySet.as_manager()
     
-    class Meta:
+    class Meta(Session.Meta):
         constraints = [
             # models.CheckConstraint(
             #     check=models.Q(start_time__lt=models.F('end_time')),
             #     name = 'starts_before_end'
             # )
         ]
+        indexes = Session.Meta.indexes + [
+            models.Index(fields=['team_id', 'day', 'start_minute', 'end_minute'], name='class_team_day_minutes_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.start_minute = to_minutes(self.start_time)
+        self.end_minute = to_minutes(self.end_time)
+        super().save(*args, **kwargs)
+
     def get_length(self):
-        date = datetime.date(1,1,1)
-        datetime1 = datetime.datetime.combine(date, self.start_time)
-        datetime2 = datetime.datetime.combine(date, self.end_time)
-        return (datetime2 - datetime1).seconds // 60
+        return self.end_minute - self.start_minute
 
     def in_minutes(self):
-        return self.start_time.hour * 60 + self.start_time.minute
+        return self.start_minute
+
+class NoticeQuerySet(models.QuerySet):
+    def live(self):
+        return self.filter(models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=timezone.now()))
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
 
 class Notice(Session):
     user_id = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    pinned = models.BooleanField(default=False)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    objects = NoticeQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
 class Event(Session):
     start = models.DateTimeField()
     end = models.DateTimeField()
+    # Repetition of the first occurrence (start/end); see session.recurrence.
+    frequency = models.CharField(max_length=1, choices=recurrence.FREQUENCIES, blank=True, default='')
+    interval = models.PositiveSmallIntegerField(default=1)
+    repeat_until = models.DateTimeField(null=True, blank=True)
+    repeat_count = models.PositiveIntegerField(null=True, blank=True)
+    exdates = models.TextField(blank=True, default='', help_text='Dates to skip, comma separated (YYYY-MM-DD)')
+    # End of the last occurrence, null while the series never ends; lets a
+    # window query find every series reaching into it from the index.
+    series_end = models.DateTimeField(null=True, editable=False)
+
+    class Meta(Session.Meta):
+        indexes = Session.Meta.indexes + [
+            models.Index(fields=['team_id', 'start', 'series_end'], name='event_team_window_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        self.series_end = recurrence.series_end({field: getattr(self, field) for field in recurrence.SERIES_FIELDS})
+        super().save(*args, **kwargs)
@@ -0,0 +1,128 @@
+import calendar
+from datetime import timedelta
+from django.core.cache import caches
+from django.utils.dateparse import parse_date
+from sirius.utils.fragments import FRAGMENT_CACHE, FRAGMENT_TIMEOUT
+
+# RRULE-style repetition of an Event (FREQ, INTERVAL, UNTIL, COUNT, EXDATE).
+# A series is stored as one row; its occurrences are only worked out for the
+# window a calendar asks for.
+
+DAILY, WEEKLY, MONTHLY, YEARLY = 'D', 'W', 'M', 'Y'
+FREQUENCIES = (
+    ('', 'Does not repeat'),
+    (DAILY, 'Daily'),
+    (WEEKLY, 'Weekly'),
+    (MONTHLY, 'Monthly'),
+    (YEARLY, 'Yearly'),
+)
+RRULE_FREQUENCIES = {DAILY: 'DAILY', WEEKLY: 'WEEKLY', MONTHLY: 'MONTHLY', YEARLY: 'YEARLY'}
+STEPS = {DAILY: timedelta(days=1), WEEKLY: timedelta(weeks=1)}
+MAX_COUNT = 1000
+SERIES_FIELDS = ('start', 'end', 'frequency', 'interval', 'repeat_until', 'repeat_count', 'exdates')
+
+
+def parse_exdates(value):
+    # Comma separated YYYY-MM-DD dates; raises ValueError on a bad entry.
+    dates = set()
+    for part in (value or '').split(','):
+        if part.strip():
+            date = parse_date(part.strip())
+            if date is None:
+                raise ValueError(f'"{part.strip()}" is not a YYYY-MM-DD date')
+            dates.add(date)
+    return dates
+
+
+def _shift_months(value, months):
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    if value.day > calendar.monthrange(year, month)[1]:
+        return None
+    return value.replace(year=year, month=month)
+
+
+def _candidate(series, index):
+    step = series['interval'] * index
+    if series['frequency'] in STEPS:
+        return series['start'] + STEPS[series['frequency']] * step
+    return _shift_months(series['start'], step * (12 if series['frequency'] == YEARLY else 1))
+
+
+def _starts(series, after=None):
+    # Occurrence starts in order, honouring COUNT and UNTIL but not EXDATE
+    # (excluded dates still count towards COUNT, as in RFC 5545). Monthly and
+    # yearly series skip dates the month lacks, e.g. the 31st or 29 February.
+    index = 0
+    if after and series['frequency'] in STEPS and after > series['start']:
+        # Daily and weekly steps never skip, so jump straight to the window.
+        index = (after - series['start']) // (STEPS[series['frequency']] * series['interval'])
+    number = index
+    while True:
+        start = _candidate(series, index)
+        index += 1
+        if start is None:
+            continue
+        if series['repeat_count'] and number >= series['repeat_count']:
+            return
+        if series['repeat_until'] and start > series['repeat_until']:
+            return
+        number += 1
+        yield start
+
+
+def occurrences(series, start, end):
+    # (start, end) pairs of the occurrences overlapping [start, end).
+    if not series['frequency']:
+        if series['start'] < end and series['end'] > start:
+            return [(series['start'], series['end'])]
+        return []
+    duration = series['end'] - series['start']
+    skip = parse_exdates(series['exdates'])
+    found = []
+    for occurrence in _starts(series, start - duration):
+        if occurrence >= end:
+            break
+        if occurrence + duration > start and occurrence.date() not in skip:
+            found.append((occurrence, occurrence + duration))
+    return found
+
+
+def series_end(series):
+    # End of the last occurrence, or None for a series that never ends.
+    duration = series['end'] - series['start']
+    if not series['frequency']:
+        return series['end']
+    if series['repeat_count']:
+        last = series['start']
+        for last in _starts(series):
+            pass
+        return last + duration
+    if series['repeat_until']:
+        return series['repeat_until'] + duration
+    return None
+
+
+def expand(events, start, end):
+    # Turns event rows (dicts with SERIES_FIELDS, 'pk' and 'updated_at') into
+    # one row per occurrence in the window. Each series' expansion is cached
+    # under its pk and updated_at, so an edit is picked up straight away.
+    keys = {}
+    for event in events:
+        if event['frequency']:
+            keys[event['pk']] = f'occurrences:{event["pk"]}:{event["updated_at"]:%Y%m%d%H%M%S%f}:{start:%Y%m%d%H%M}:{end:%Y%m%d%H%M}'
+    cache = caches[FRAGMENT_CACHE]
+    cached = cache.get_many(keys.values()) if keys else {}
+    missing, rows = {}, []
+    for event in events:
+        key = keys.get(event['pk'])
+        if key in cached:
+            found = cached[key]
+        else:
+            found = occurrences(event, start, end)
+            if key:
+                missing[key] = found
+        rows += [dict(event, start=occurrence_start, end=occurrence_end) for occurrence_start, occurrence_end in found]
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+    return rows
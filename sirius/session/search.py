@@ -0,0 +1,141 @@
+import uuid
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Full-text index over notice and event titles/descriptions, kept in an SQLite
+# FTS5 table next to the session tables. session/apps.py creates it after
+# migrate and keeps it in sync on save/delete. On other databases the index
+# is not built and search is reported as unavailable.
+
+SEARCH_TABLE = 'session_search'
+# Plain table holding the permission scope of every indexed row under the
+# same rowid. Scoping is an exact, indexed IN lookup there, so it never goes
+# through the stemming tokenizer of the text index.
+SCOPE_TABLE = 'session_search_scope'
+PAGE_SIZE = 20
+NOTICE, EVENT = 'N', 'E'
+KINDS = {'notice': NOTICE, 'event': EVENT}
+SOURCES = ((NOTICE, 'session_notice'), (EVENT, 'session_event'))
+# Title matches count five times as much as description matches.
+TITLE_WEIGHT = 5.0
+# Markers put around matches by highlight()/snippet(); they are swapped for
+# <mark> after the text has been escaped.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def search_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, pk):
+    # Notices and events share one rowid space (even/odd), so an update or a
+    # delete is a rowid lookup rather than a scan of the unindexed columns.
+    return pk * 2 + (kind == EVENT)
+
+
+def _team_key(team_id):
+    return uuid.UUID(str(team_id)).hex
+
+
+def _scope(kind, team_id):
+    # "<kind><team hex>", e.g. "n3f2a..." for the notices of a team.
+    return kind.lower() + _team_key(team_id)
+
+
+def create_index(sender=None, rebuild=False, **kwargs):
+    if not search_enabled():
+        return
+    tables = connection.introspection.table_names()
+    if any(table not in tables for _, table in SOURCES):
+        return
+    with connection.cursor() as cursor:
+        if SEARCH_TABLE in tables and SCOPE_TABLE in tables and not rebuild:
+            return
+        # Indexes built before the scope table existed are rebuilt as well.
+        for table in (SEARCH_TABLE, SCOPE_TABLE):
+            if table in tables:
+                cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(title, description, kind UNINDEXED, session_id UNINDEXED, team_id UNINDEXED, tokenize='porter unicode61')")
+        cursor.execute(f'CREATE TABLE {SCOPE_TABLE} (id INTEGER PRIMARY KEY, scope TEXT NOT NULL)')
+        cursor.execute(f'CREATE INDEX {SCOPE_TABLE}_scope_idx ON {SCOPE_TABLE} (scope, id)')
+        for kind, table in SOURCES:
+            rowid = f'id * 2 + {int(kind == EVENT)}'
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, kind, session_id, team_id) "
+                f"SELECT {rowid}, title, COALESCE(description, ''), %s, id, team_id_id FROM {table}",
+                [kind],
+            )
+            cursor.execute(f'INSERT INTO {SCOPE_TABLE} (id, scope) SELECT {rowid}, %s || team_id_id FROM {table}', [kind.lower()])
+
+
+def index_session(sender, instance, **kwargs):
+    if not search_enabled():
+        return
+    kind = KINDS[sender._meta.model_name]
+    rowid = _rowid(kind, instance.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, kind, session_id, team_id) VALUES (%s, %s, %s, %s, %s, %s)',
+            [rowid, instance.title, instance.description or '', kind, instance.pk, _team_key(instance.team_id_id)],
+        )
+        cursor.execute(f'INSERT OR REPLACE INTO {SCOPE_TABLE} (id, scope) VALUES (%s, %s)', [rowid, _scope(kind, instance.team_id_id)])
+
+
+def unindex_session(sender, instance, **kwargs):
+    if not search_enabled():
+        return
+    rowid = _rowid(KINDS[sender._meta.model_name], instance.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(f'DELETE FROM {SCOPE_TABLE} WHERE id = %s', [rowid])
+
+
+def unindex_sessions(kind, pks):
+    # Bulk counterpart of unindex_session for rows deleted without signals.
+    if not search_enabled() or not pks or SEARCH_TABLE not in connection.introspection.table_names():
+        return
+    rowids = [_rowid(kind, pk) for pk in pks]
+    placeholders = ', '.join(['%s'] * len(rowids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', rowids)
+        cursor.execute(f'DELETE FROM {SCOPE_TABLE} WHERE id IN ({placeholders})', rowids)
+
+
+def fts_query(text):
+    # Every word becomes a quoted prefix term, so user input can never be
+    # read as FTS5 syntax (AND/OR/NEAR, column filters, stray quotes).
+    return ' '.join('"%s"*' % word.replace('"', '""') for word in text.split())
+
+
+def _marked(text):
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search(text, notice_teams, event_teams, page=0, size=PAGE_SIZE):
+    # Ranked matches among notices of `notice_teams` and events of
+    # `event_teams` (team ids). Returns (rows, has_next).
+    query = fts_query(text)
+    scopes = [_scope(NOTICE, team) for team in notice_teams] + [_scope(EVENT, team) for team in event_teams]
+    if not query or not scopes:
+        return [], False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT kind, session_id, team_id, highlight({SEARCH_TABLE}, 0, %s, %s), snippet({SEARCH_TABLE}, 1, %s, %s, %s, 24) '
+            # A join, not "rowid IN (SELECT ...)": FTS5 would run the MATCH
+            # again for every rowid of the subquery.
+            f'FROM {SEARCH_TABLE} JOIN {SCOPE_TABLE} ON {SCOPE_TABLE}.id = {SEARCH_TABLE}.rowid '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND {SCOPE_TABLE}.scope IN ({", ".join(["%s"] * len(scopes))}) '
+            f'ORDER BY bm25({SEARCH_TABLE}, %s, 1.0) LIMIT %s OFFSET %s',
+            [MARK_START, MARK_END, MARK_START, MARK_END, '…', query, *scopes, TITLE_WEIGHT, size + 1, page * size],
+        )
+        rows = cursor.fetchall()
+    results = [{
+        'kind': kind,
+        'pk': session_id,
+        'team_id': uuid.UUID(team_id),
+        'title': _marked(title),
+        'snippet': _marked(snippet),
+    } for kind, session_id, team_id, title, snippet in rows[:size]]
+    return results, len(rows) > size
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from importlib import import_module
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import transaction
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+from sirius.utils.perm import teams_with_perm
+from sirius.utils.pubsub import get_broker
+
+# Server-sent events for new, updated and deleted notices and events. The
+# stream is a plain ASGI app mounted in sirius/asgi.py rather than a Django
+# view, so an idle connection is one suspended coroutine, not a thread.
+
+STREAM_PATH = '/user/stream/'
+# Comment line sent when nothing happened, so proxies keep the line open.
+KEEPALIVE = 25
+# Streams are closed after this many seconds; EventSource reconnects at once,
+# which also picks up permission changes since the connection was opened.
+MAX_AGE = 60 * 60
+CHANNELS = {'notice': ('R', 'N'), 'event': ('R', 'E')}
+
+
+def channel(kind, team_id):
+    return f'team:{team_id}:{kind}'
+
+
+def publish_session(sender, instance, created=None, **kwargs):
+    # post_save/post_delete handler; published once the change is committed.
+    kind = sender._meta.model_name
+    action = 'deleted' if created is None else 'created' if created else 'updated'
+    message = {
+        'type': kind,
+        'action': action,
+        'id': instance.pk,
+        'team': str(instance.team_id_id),
+        'title': instance.title,
+    }
+    if kind == 'event' and action != 'deleted':
+        message['url'] = reverse('team:session:event_detail', kwargs={'pk': instance.team_id_id, 'e_pk': instance.pk})
+    elif kind == 'notice':
+        message['url'] = reverse('team:session:notice_board', kwargs={'pk': instance.team_id_id})
+    transaction.on_commit(lambda: get_broker().publish(channel(kind, instance.team_id_id), message))
+
+
+def _user_channels(session_key):
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(request)
+    if not user.is_authenticated:
+        return None
+    channels = []
+    for kind, (action, relation) in CHANNELS.items():
+        channels += [channel(kind, row['team_id']) for row in teams_with_perm(action, relation, user)]
+    return channels
+
+
+async def _send_status(send, status):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def notice_stream(scope, receive, send):
+    if scope['method'] != 'GET':
+        return await _send_status(send, 405)
+    headers = dict(scope['headers'])
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    channels = await sync_to_async(_user_channels)(cookies.get(settings.SESSION_COOKIE_NAME))
+    if channels is None:
+        return await _send_status(send, 403)
+    subscription = get_broker().subscribe(channels)
+    disconnect = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        deadline = asyncio.get_running_loop().time() + MAX_AGE
+        while asyncio.get_running_loop().time() < deadline:
+            message = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({message, disconnect}, timeout=KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                message.cancel()
+                return
+            if message in done:
+                body = f'event: {message.result()["type"]}\ndata: {json.dumps(message.result())}\n\n'
+            else:
+                message.cancel()
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        subscription.close()
+        disconnect.cancel()
@@ -1,3 +1,283 @@
-from django.test import TestCase
+import re
+from datetime import datetime, time, timedelta
+from unittest import mock
+from urllib.parse import unquote
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from authorization.models import Membership, Role
+from session.freebusy import free_slots, merge
+from session.models import Class, Event, Notice
+from session.recurrence import DAILY, MONTHLY, WEEKLY, occurrences, parse_exdates, series_end
+from session.search import search
+from session import views
+from session.utils import events_in_window, find_clashes, parse_timetable
+from sirius.utils.pagination import keyset_page, parse_cursor
+from sirius.utils.perm import mask_from_pks
+from team.models import Team
+from team.utils import init_roles
 
 # Create your tests here.
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email='user@example.com', password='pw', username='user')
+        team = Team.objects.create(name='Team', description='')
+        for number in range(7):
+            Notice.objects.create(title=f'Notice {number}', team_id=team, user_id=user)
+        # Five notices share one timestamp, the pk breaks the tie.
+        self.tied = datetime(2024, 1, 1, 12)
+        Notice.objects.update(created_at=self.tied)
+        Notice.objects.filter(pk__in=Notice.objects.order_by('pk').values('pk')[:2]).update(created_at=datetime(2024, 1, 1, 11))
+        self.notices = Notice.objects.values('pk', 'created_at')
+
+    def test_pages_cover_tied_rows_once(self):
+        seen, cursor = [], None
+        while True:
+            rows, next_cursor = keyset_page(self.notices, parse_cursor(cursor) if cursor else None, size=2)
+            seen += [row['pk'] for row in rows]
+            if not next_cursor:
+                break
+            cursor = next_cursor
+        expected = list(Notice.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        expected = list(Notice.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        rows, cursor = keyset_page(self.notices, size=3)
+        notice = Notice.objects.first()
+        Notice.objects.create(title='Newer', team_id=notice.team_id, user_id=notice.user_id)
+        next_rows, _ = keyset_page(self.notices, parse_cursor(cursor), size=3)
+        self.assertEqual([row['pk'] for row in next_rows], expected[3:6])
+
+    def test_last_page_has_no_cursor(self):
+        rows, cursor = keyset_page(self.notices, size=7)
+        self.assertEqual(len(rows), 7)
+        self.assertIsNone(cursor)
+
+    def test_malformed_cursor(self):
+        self.assertEqual(parse_cursor('2024-01-01T12:00:00_5'), (self.tied, 5))
+        self.assertIsNone(parse_cursor('garbage'))
+        self.assertIsNone(parse_cursor('2024-01-01T12:00:00_x'))
+
+
+class ClassOverlapTests(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='Team', description='')
+        Class.objects.create(title='Maths', team_id=self.team, day='0', start_time=time(10), end_time=time(11))
+
+    def overlaps(self, start, end, day='0', team=None):
+        return Class.objects.overlapping(team or self.team, day, start, end).exists()
+
+    def test_touching_edges_do_not_overlap(self):
+        self.assertFalse(self.overlaps(time(9), time(10)))
+        self.assertFalse(self.overlaps(time(11), time(12)))
+
+    def test_one_minute_inside_overlaps(self):
+        self.assertTrue(self.overlaps(time(9), time(10, 1)))
+        self.assertTrue(self.overlaps(time(10, 59), time(12)))
+
+    def test_containing_and_contained(self):
+        self.assertTrue(self.overlaps(time(9), time(12)))
+        self.assertTrue(self.overlaps(time(10, 15), time(10, 30)))
+        self.assertTrue(self.overlaps(time(10), time(11)))
+
+    def test_other_day_or_team(self):
+        self.assertFalse(self.overlaps(time(10), time(11), day='1'))
+        self.assertFalse(self.overlaps(time(10), time(11), team=Team.objects.create(name='Other', description='')))
+
+
+class TimetableImportTests(TestCase):
+    def row(self, line, start, end, day='0'):
+        return {'line': line, 'title': f'Row {line}', 'day': day, 'start_time': time(*start), 'end_time': time(*end)}
+
+    def test_only_later_row_of_a_clash_is_rejected(self):
+        rows = [self.row(2, (9,), (10,)), self.row(3, (9, 30), (10, 30)), self.row(4, (10,), (11,))]
+        # Row 3 clashes with row 2; once it is rejected row 4 fits after row 2.
+        self.assertEqual(find_clashes(rows, []), {3: 'Overlaps with "Row 2" (line 2)'})
+
+    def test_clash_with_existing_classes(self):
+        existing = [
+            {'day': '0', 'start_time': time(12), 'end_time': time(13), 'title': 'Lunch'},
+            {'day': '0', 'start_time': time(12, 30), 'end_time': time(14), 'title': 'Lab'},
+        ]
+        rows = [self.row(2, (11,), (12,)), self.row(3, (13, 30), (15,)), self.row(4, (14,), (15,)), self.row(5, (12,), (13,), day='1')]
+        self.assertEqual(find_clashes(rows, existing), {3: 'Overlaps with "Lunch"'})
+
+    def test_rows_are_checked_in_file_order(self):
+        rows = [self.row(3, (8,), (9,)), self.row(2, (8, 30), (9, 30))]
+        self.assertEqual(find_clashes(rows, []), {3: 'Overlaps with "Row 2" (line 2)'})
+
+    def test_csv_rows_keep_file_lines(self):
+        upload = SimpleUploadedFile('timetable.csv', b'title,day,start_time,end_time\nMaths,Monday,09:00,10:00\n\nArt,Funday,10:00,11:00\nPE,0,11:00,10:00\n')
+        rows, errors = parse_timetable(upload, Class.DAYS_OF_WEEK)
+        self.assertEqual([(row['line'], row['title'], row['day']) for row in rows], [(2, 'Maths', '0')])
+        self.assertEqual(errors, [(4, 'Invalid row: unknown day "Funday"'), (5, 'Invalid time range')])
+
+
+class RecurrenceTests(TestCase):
+    def series(self, start, frequency, **kwargs):
+        return dict({'start': start, 'end': start + timedelta(hours=1), 'frequency': frequency, 'interval': 1, 'repeat_until': None, 'repeat_count': None, 'exdates': ''}, **kwargs)
+
+    def starts(self, series, start=datetime(2024, 1, 1), end=datetime(2025, 1, 1)):
+        return [occurrence_start for occurrence_start, _ in occurrences(series, start, end)]
+
+    def test_count(self):
+        series = self.series(datetime(2024, 1, 1, 9), WEEKLY, repeat_count=3)
+        self.assertEqual(self.starts(series), [datetime(2024, 1, 1, 9), datetime(2024, 1, 8, 9), datetime(2024, 1, 15, 9)])
+        self.assertEqual(series_end(series), datetime(2024, 1, 15, 10))
+
+    def test_until_is_inclusive(self):
+        series = self.series(datetime(2024, 1, 1, 9), DAILY, interval=2, repeat_until=datetime(2024, 1, 5, 9))
+        self.assertEqual(self.starts(series), [datetime(2024, 1, 1, 9), datetime(2024, 1, 3, 9), datetime(2024, 1, 5, 9)])
+
+    def test_exdates_skip_but_count(self):
+        series = self.series(datetime(2024, 1, 1, 9), DAILY, repeat_count=3, exdates='2024-01-02')
+        self.assertEqual(self.starts(series), [datetime(2024, 1, 1, 9), datetime(2024, 1, 3, 9)])
+        with self.assertRaises(ValueError):
+            parse_exdates('2024-01-02, tomorrow')
+
+    def test_monthly_skips_short_months(self):
+        series = self.series(datetime(2024, 1, 31, 9), MONTHLY, repeat_count=4)
+        self.assertEqual(self.starts(series), [datetime(2024, 1, 31, 9), datetime(2024, 3, 31, 9), datetime(2024, 5, 31, 9), datetime(2024, 7, 31, 9)])
+        self.assertEqual(series_end(series), datetime(2024, 7, 31, 10))
+
+    def test_window_edges(self):
+        series = self.series(datetime(2024, 1, 1, 9), DAILY)
+        # Occurrences ending at the window start or starting at its end are out.
+        self.assertEqual(self.starts(series, datetime(2024, 1, 3, 10), datetime(2024, 1, 5, 9)), [datetime(2024, 1, 4, 9)])
+        self.assertEqual(self.starts(series, datetime(2024, 1, 3, 9, 30), datetime(2024, 1, 3, 9, 45)), [datetime(2024, 1, 3, 9)])
+        self.assertIsNone(series_end(series))
+
+    def test_window_query_finds_old_series(self):
+        team = Team.objects.create(name='Team', description='')
+        Event.objects.create(title='Standup', team_id=team, start=datetime(2020, 1, 6, 9), end=datetime(2020, 1, 6, 9, 15), frequency=WEEKLY)
+        Event.objects.create(title='Done', team_id=team, start=datetime(2020, 1, 6, 9), end=datetime(2020, 1, 6, 9, 15), frequency=WEEKLY, repeat_count=2)
+        rows = events_in_window(Event.objects.filter(team_id=team), datetime(2024, 1, 1), datetime(2024, 1, 15))
+        self.assertEqual([(row['title'], row['start']) for row in rows], [('Standup', datetime(2024, 1, 1, 9)), ('Standup', datetime(2024, 1, 8, 9))])
+
+
+class FreeBusyTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.team = Team.objects.create(name='Team', description='')
+        other = Team.objects.create(name='Other', description='')
+        first = User.objects.create_user(email='first@example.com', password='pw', username='first')
+        second = User.objects.create_user(email='second@example.com', password='pw', username='second')
+        for user, team in ((first, self.team), (second, self.team), (second, other)):
+            Membership.objects.create(user_id=user, team_id=team, role_id=Role.objects.get_or_create(role_name='Member', team_id=team, role_description='')[0])
+        # 7 January 2030 is a Monday.
+        Class.objects.create(title='Maths', team_id=other, day='0', start_time=time(10), end_time=time(11))
+        Event.objects.create(title='Meeting', team_id=self.team, start=datetime(2030, 1, 7, 13), end=datetime(2030, 1, 7, 13, 30))
+        Event.objects.create(title='Elsewhere', team_id=Team.objects.create(name='Unrelated', description=''), start=datetime(2030, 1, 7, 15), end=datetime(2030, 1, 7, 16))
+
+    def test_merge(self):
+        intervals = [(50, 70), (-10, 5), (60, 80), (80, 90), (100, 120), (200, 300), (30, 30)]
+        self.assertEqual(merge(intervals, 150), [[0, 5], [50, 90], [100, 120]])
+        self.assertEqual(merge([], 150), [])
+
+    def test_free_slots_cover_every_members_teams(self):
+        slots = free_slots(self.team.pk, datetime(2030, 1, 7), datetime(2030, 1, 8), 60, day_start=9 * 60, day_end=17 * 60)
+        self.assertEqual(slots, [
+            (datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10)),
+            (datetime(2030, 1, 7, 11), datetime(2030, 1, 7, 13)),
+            (datetime(2030, 1, 7, 13, 30), datetime(2030, 1, 7, 17)),
+        ])
+
+    def test_short_gaps_are_dropped(self):
+        slots = free_slots(self.team.pk, datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 14), 121)
+        self.assertEqual(slots, [])
+
+
+class SearchScopeTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        User = get_user_model()
+        owner = User.objects.create_user(email='owner@example.com', password='pw', username='owner')
+        self.user = User.objects.create_user(email='user@example.com', password='pw', username='user')
+        self.mine, self.events_only, self.hidden = [Team.objects.create(name=name, description='') for name in ('Mine', 'Events only', 'Hidden')]
+        for team in (self.mine, self.events_only, self.hidden):
+            init_roles(team, owner)
+            Notice.objects.create(title=f'Budget meeting of {team.name}', team_id=team, user_id=owner)
+            Event.objects.create(title=f'Budget review of {team.name}', team_id=team, start=datetime(2024, 1, 1, 9), end=datetime(2024, 1, 1, 10))
+        Membership.objects.create(user_id=self.user, team_id=self.mine, role_id=Role.objects.get(team_id=self.mine, role_name='Member'))
+        # Read events (pk 2) but not notices.
+        role = Role.objects.create(role_name='Guest', team_id=self.events_only, role_description='', permission_mask=mask_from_pks([2]))
+        Membership.objects.create(user_id=self.user, team_id=self.events_only, role_id=role)
+
+    def results(self, text):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('user:search'), {'q': text})
+        return {(result['kind'], result['team_id']) for result in response.context['results']}
+
+    def test_results_are_scoped_by_permission(self):
+        self.assertEqual(self.results('budget'), {('N', self.mine.id), ('E', self.mine.id), ('E', self.events_only.id)})
+
+    def test_stemmed_match_stays_scoped(self):
+        self.assertEqual(self.results('meetings'), {('N', self.mine.id)})
+        self.assertEqual(self.results('hidden'), set())
+
+    def test_deleted_rows_leave_the_index(self):
+        Notice.objects.filter(team_id=self.mine).get().delete()
+        rows, has_next = search('budget', [self.mine.id, self.hidden.id], [])
+        self.assertEqual([row['team_id'] for row in rows], [self.hidden.id])
+        self.assertFalse(has_next)
+
+
+class NoticeBoardTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='pw', username='user')
+        self.team = Team.objects.create(name='Team', description='')
+        init_roles(self.team, self.user)
+        for number in range(5):
+            Notice.objects.create(title=f'Notice {number}', team_id=self.team, user_id=self.user, pinned=number == 0)
+        self.client.force_login(self.user)
+
+    def test_every_live_notice_is_reachable(self):
+        seen, url = [], reverse('team:session:notice_board', kwargs={'pk': self.team.pk})
+        with mock.patch.object(views, 'BOARD_LIMIT', 2):
+            response = self.client.get(url)
+            while True:
+                seen += re.findall(r'Notice \d', response.content.decode())
+                cursor = re.search(r'before=([^"&]+)', response.content.decode())
+                if not cursor:
+                    break
+                response = self.client.get(url, {'before': unquote(cursor.group(1))})
+        self.assertEqual(seen, ['Notice 0', 'Notice 4', 'Notice 3', 'Notice 2', 'Notice 1'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('team:session:notice_board', kwargs={'pk': self.team.pk}), {'before': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncConditionalTests(TransactionTestCase):
+    # The gathered reads run on worker threads with connections of their
+    # own, which would wait on the transaction of a TestCase.
+    fixtures = ['permissions']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='pw', username='user')
+        self.team = Team.objects.create(name='Team', description='')
+        init_roles(self.team, self.user)
+        Notice.objects.create(title='Notice', team_id=self.team, user_id=self.user)
+
+    def get(self, **headers):
+        request = RequestFactory().get(reverse('user:bulletin'), **headers)
+        request.user = get_user_model().objects.get(pk=self.user.pk)
+        return async_to_sync(views.user_bulletin_async)(request)
+
+    def test_not_modified_skips_the_view(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(Membership.objects.get(user_id=self.user).notices_seen_at)
+        with mock.patch.object(views, 'keyset_page') as page, mock.patch.object(views, 'mark_notices_seen') as seen:
+            response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        page.assert_not_called()
+        seen.assert_not_called()
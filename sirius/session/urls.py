@@ -5,9 +5,14 @@ app_name = 'session'
 
 urlpatterns = [
     path('timetable/', timetable, name='timetable'),
+    path('timetable/import/', import_timetable, name='import_timetable'),
     path('calendar/', calendar, name='calendar'),
+    path('calendar/events/', calendar_events, name='calendar_events'),
+    path('freebusy/', freebusy, name='freebusy'),
+    path('calendar.ics', team_calendar_feed, name='calendar_feed'),
     
     path('notices/', notice_board, name='notice_board'),
+    path('notices/archive/', notice_archive, name='notice_archive'),
     path('notice/update/<int:n_pk>/', update_notice, name='update_notice'),
     path('notice/delete/<int:n_pk>/', delete_notice, name='delete_notice'),
     path('notice/create/', create_notice, name='create_notice'),
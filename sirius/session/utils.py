@@ -0,0 +1,219 @@
+import csv
+import io
+import json
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from django.core.cache import caches
+from django.db.models import Count, F, Q
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from sirius.utils.fragments import FRAGMENT_CACHE, FRAGMENT_TIMEOUT
+from sirius.utils.perm import teams_with_perm
+from authorization.models import Membership
+from .models import Class, Notice
+from .recurrence import SERIES_FIELDS, expand
+
+# Widest window an events feed will serve; FullCalendar asks for at most six
+# weeks at a time in month view.
+MAX_WINDOW = timedelta(days=100)
+
+
+def _parse_bound(value):
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            parsed = datetime.combine(date, time.min) if date else None
+    except ValueError:
+        return None
+    if parsed and timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed)
+    return parsed
+
+
+def parse_window(request):
+    # FullCalendar event-source params: ?start=<iso>&end=<iso>.
+    start = _parse_bound(request.GET.get('start', ''))
+    end = _parse_bound(request.GET.get('end', ''))
+    if not start or not end or start >= end or end - start > MAX_WINDOW:
+        return None
+    return start, end
+
+
+EVENT_VALUES = ('pk', 'title', 'team_id__id', 'updated_at') + SERIES_FIELDS
+
+
+def events_in_window(events, start, end):
+    # One row per occurrence in the window; recurring series are expanded.
+    events = events.filter(Q(series_end__gt=start) | Q(series_end__isnull=True), start__lt=end)
+    return expand(list(events.values(*EVENT_VALUES)), start, end)
+
+
+def event_json(event):
+    return {
+        'id': event['pk'],
+        'title': event['title'],
+        'start': event['start'].isoformat(),
+        'end': event['end'].isoformat(),
+        'description': f"{event['title']} ({event['start']:%d %b %H:%M} - {event['end']:%d %b %H:%M})",
+        'url': reverse('team:session:event_detail', kwargs={'pk': event['team_id__id'], 'e_pk': event['pk']}),
+    }
+
+
+def weekly_schedule(user, state):
+    # {weekday: [class rows]} for every team whose timetable the user can
+    # read. Cached per user under the version digest of their teams
+    # (conditional.user_state), which moves with any class, membership or
+    # role change, so a warm calendar never queries the class table.
+    key = f'weekly-schedule:{user.pk}:{state["teams"]}:{state["version"]}'
+    cache = caches[FRAGMENT_CACHE]
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = {}
+        classes = Class.objects.filter(team_id__in=teams_with_perm('R', 'C', user)).order_by('start_minute')
+        for class_ in classes.values('pk', 'title', 'day', 'start_time', 'end_time', 'created_at', 'team_id__id', 'team_id__name'):
+            schedule.setdefault(int(class_['day']), []).append(class_)
+        cache.set(key, schedule, FRAGMENT_TIMEOUT)
+    return schedule
+
+
+def classes_in_window(schedule, start, end):
+    # Dated occurrences of the weekly slots, from the week each class was
+    # created in (the iCal feed anchors its RRULE the same way).
+    rows = []
+    day = start.date()
+    while day <= end.date():
+        for class_ in schedule.get(day.weekday(), ()):
+            class_start = datetime.combine(day, class_['start_time'])
+            class_end = datetime.combine(day, class_['end_time'])
+            if class_['created_at'].date() <= day and class_start < end and class_end > start:
+                rows.append(class_json(class_, class_start, class_end))
+        day += timedelta(days=1)
+    return rows
+
+
+def class_json(class_, start, end):
+    return {
+        'id': f'class-{class_["pk"]}',
+        'title': class_['title'],
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'description': f"{class_['title']}, {class_['team_id__name']} ({start:%H:%M} - {end:%H:%M})",
+        'url': reverse('team:session:class_detail', kwargs={'pk': class_['team_id__id'], 'c_pk': class_['pk']}),
+    }
+
+
+def mark_notices_seen(user, teams):
+    # Only moved when the team changed since the last visit, so a board that
+    # is simply reloaded keeps its ETag (the watermark is part of it). The
+    # watermark lives on Membership: teams reached only through an inherited
+    # role have none and are skipped.
+    memberships = Membership.objects.filter(user_id=user, team_id__in=teams).filter(
+        Q(notices_seen_at__isnull=True) | Q(notices_seen_at__lt=F('team_id__content_updated_at'))
+    )
+    memberships.update(notices_seen_at=timezone.now())
+
+
+def unread_notice_counts(user, teams=None):
+    # {team id: live notices by others created after the member's watermark},
+    # for the user's teams (or `teams`) where they can read notices. Only
+    # directly joined teams are counted; sub-teams reached through an
+    # inherited role have no watermark and no entry (callers show no badge).
+    # One grouped query over the (team, created_at) index; the membership
+    # conditions stay in one filter() so they share a single join.
+    notices = Notice.objects.live().exclude(user_id=user).filter(
+        team_id__in=teams_with_perm('R', 'N', user, teams),
+        team_id__membership__user_id=user,
+        created_at__gt=Coalesce(F('team_id__membership__notices_seen_at'), F('team_id__membership__created_at')),
+    )
+    return dict(notices.values('team_id').annotate(unread=Count('id')).values_list('team_id', 'unread'))
+
+
+IMPORT_FIELDS = ('title', 'day', 'start_time', 'end_time', 'description')
+
+
+def _parse_day(value, days):
+    value = str(value).strip()
+    for key, name in days:
+        if value == key or value.lower() == name.lower():
+            return key
+    raise ValueError(f'unknown day "{value}"')
+
+
+def _parse_time(value):
+    return time.fromisoformat(str(value).strip())
+
+
+def parse_timetable(upload, days):
+    # Reads a .csv (header row) or .json (list of objects) upload with the
+    # IMPORT_FIELDS columns. Returns (rows, errors); every row keeps its line
+    # in the file (its position in the list for JSON) so errors and clashes
+    # point at what the user uploaded.
+    text = upload.read().decode('utf-8-sig')
+    if upload.name.lower().endswith('.json'):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError('JSON timetable must be a list of classes')
+        records = list(enumerate(records, start=1))
+    else:
+        # line_num counts the header and the blank lines DictReader skips.
+        reader = csv.DictReader(io.StringIO(text))
+        records = [(reader.line_num, record) for record in reader]
+    rows, errors = [], []
+    for line, record in records:
+        try:
+            row = {
+                'line': line,
+                'title': str(record.get('title') or '').strip(),
+                'day': _parse_day(record.get('day', ''), days),
+                'start_time': _parse_time(record.get('start_time', '')),
+                'end_time': _parse_time(record.get('end_time', '')),
+                'description': str(record.get('description') or '').strip(),
+            }
+        except (ValueError, AttributeError) as e:
+            errors.append((line, f'Invalid row: {e}'))
+            continue
+        if not row['title']:
+            errors.append((line, 'Title is required'))
+        elif row['start_time'] >= row['end_time']:
+            errors.append((line, 'Invalid time range'))
+        else:
+            rows.append(row)
+    return rows, errors
+
+
+def find_clashes(rows, existing):
+    # Takes the imported rows in file order and rejects a row when it
+    # overlaps an existing class or an earlier accepted row, so of two
+    # clashing rows only the later one goes. Per day the blocking intervals
+    # are kept sorted and disjoint (existing classes merged up front), so
+    # each check is one bisect against two neighbours. Accepting a row is a
+    # list insert, linear in the day's blocks, so the worst case is quadratic
+    # in the rows of one day; a day holds at most a few dozen classes, and
+    # sorting once instead would judge rows by start time, not file order.
+    # Returns {line: message}.
+    blocks = {}
+    for class_ in sorted(existing, key=lambda class_: (class_['start_time'], class_['end_time'])):
+        day = blocks.setdefault(class_['day'], [])
+        if day and class_['start_time'] < day[-1][1]:
+            day[-1] = (day[-1][0], max(day[-1][1], class_['end_time']), None, day[-1][3])
+        else:
+            day.append((class_['start_time'], class_['end_time'], None, class_['title']))
+    starts = {day: [block[0] for block in day_blocks] for day, day_blocks in blocks.items()}
+    clashes = {}
+    for row in sorted(rows, key=lambda row: row['line']):
+        day_blocks = blocks.setdefault(row['day'], [])
+        day_starts = starts.setdefault(row['day'], [])
+        i = bisect_right(day_starts, row['start_time'])
+        if i and day_blocks[i - 1][1] > row['start_time']:
+            other = day_blocks[i - 1]
+        elif i < len(day_blocks) and day_blocks[i][0] < row['end_time']:
+            other = day_blocks[i]
+        else:
+            day_blocks.insert(i, (row['start_time'], row['end_time'], row['line'], row['title']))
+            day_starts.insert(i, row['start_time'])
+            continue
+        clashes[row['line']] = f'Overlaps with "{other[3]}"' + (f' (line {other[2]})' if other[2] else '')
+    return clashes
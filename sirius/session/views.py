@@ -1,15 +1,45 @@
 from django.shortcuts import render, redirect
-from .forms import ClassCreationForm, CalendarCreationForm, NoticeCreationForm, CalendarUpdationForm, NoticeUpdationForm, ClassUpdationForm
+from django.template.loader import render_to_string
+from django.utils import timezone
+from datetime import time
+from .forms import ClassCreationForm, CalendarCreationForm, NoticeCreationForm, CalendarUpdationForm, NoticeUpdationForm, ClassUpdationForm, TimetableImportForm
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import BadRequest
-from .models import Class, Notice, Event
+from .models import Class, Notice, Event, to_minutes
+from .utils import parse_window, events_in_window, event_json, weekly_schedule, classes_in_window, mark_notices_seen, parse_timetable, find_clashes
+from .freebusy import free_slots
+from .search import search, search_enabled
+from .ical import feed_token, read_feed_token, feed_state, stream_calendar
 from authorization.models import Membership, Permission, Role
-from django.http import HttpResponseForbidden, HttpResponseBadRequest
-from sirius.utils.perm import has_perm
+from django.http import HttpResponseForbidden, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.contrib.auth import get_user_model
+from sirius.utils.perm import has_perm, perm_required, teams_with_perm, resolve_perms, reachable_teams
+from sirius.utils.fragments import cached_fragment, invalidate_team_fragments, FRAGMENT_TIMEOUT
 from sirius.utils.console_context import get_console_data
+from sirius.utils.pagination import keyset_page, parse_cursor
+from sirius.utils.conditional import team_conditional, team_conditional_expiring, user_conditional, user_state, user_etag, user_last_modified
+from sirius.utils.concurrent import async_login_required, async_conditional, gather_reads
 from django.shortcuts import get_object_or_404
+from django.db.models import F
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db import transaction
+from asgiref.sync import sync_to_async
 from team.models import Team
 
+# Upper bound on rows fetched when a board is rolled up over a subtree.
+ROLLUP_LIMIT = 500
+# Live notices shown on a single team's board.
+BOARD_LIMIT = 100
+
+def include_sub_teams(request):
+    return request.GET.get('subteams') == '1'
+
+def rollup_teams(action, relation, user, pk):
+    # The team plus every sub-team the user may read, as a single subquery.
+    subtree = Team.objects.get(id=pk).descendants(include_self=True)
+    return teams_with_perm(action, relation, user, subtree)
+
 
 @login_required(login_url='user:signin')
 def create_class(request, pk):
@@ -28,6 +58,36 @@ def create_class(request, pk):
         form = ClassCreationForm()
     return render(request, 'create_class.html', {'form': form, 'console': get_console_data(pk, request.user)})
 
+@login_required(login_url='user:signin')
+@perm_required(('C', 'C'))
+def import_timetable(request, pk):
+    created, errors = None, []
+    if request.method == 'POST':
+        form = TimetableImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows, errors = parse_timetable(form.cleaned_data['file'], Class.DAYS_OF_WEEK)
+            except (ValueError, UnicodeDecodeError) as e:
+                rows, errors = [], [(None, f'Could not read file: {e}')]
+            existing = Class.objects.filter(team_id=pk, day__in={row['day'] for row in rows}).values('day', 'start_time', 'end_time', 'title')
+            clashes = find_clashes(rows, existing)
+            errors += clashes.items()
+            team = Team.objects.get(id=pk)
+            valid = [row for row in rows if row['line'] not in clashes]
+            classes = [Class(team_id=team, start_minute=to_minutes(row['start_time']), end_minute=to_minutes(row['end_time']), **{field: row[field] for field in ('title', 'day', 'start_time', 'end_time', 'description')}) for row in valid]
+            # bulk_create skips save() and the post_save signals, so the
+            # minute columns are filled above and the caches are moved here.
+            with transaction.atomic():
+                Class.objects.bulk_create(classes, batch_size=500)
+            if classes:
+                Team.bump_version(pk)
+                invalidate_team_fragments(pk)
+            created = len(valid)
+            errors.sort(key=lambda error: error[0] or 0)
+    else:
+        form = TimetableImportForm()
+    return render(request, 'import_timetable.html', {'form': form, 'created': created, 'errors': errors, 'console': get_console_data(pk, request.user)})
+
 @login_required(login_url='user:signin')
 def create_event(request, pk):
     if request.method == 'POST':
@@ -107,9 +167,8 @@ def update_notice(request, pk, n_pk):
     return render(request, 'create_notice.html', {'form': form, 'console': get_console_data(pk, request.user), 'n_pk': n_pk})
 
 @login_required(login_url='user:signin')
+@perm_required(('D', 'C'))
 def delete_class(request, pk, c_pk):
-    if not has_perm('D', 'C', request.user, pk):
-        return HttpResponseForbidden()
     class_ = Class.objects.get(pk=c_pk)
     if class_:
         if str(class_.team_id.id) != str(pk):
@@ -119,9 +178,8 @@ def delete_class(request, pk, c_pk):
     return HttpResponseBadRequest()
 
 @login_required(login_url='user:signin')
+@perm_required(('D', 'E'))
 def delete_event(request, pk, e_pk):
-    if not has_perm('D', 'E', request.user, pk):
-        return HttpResponseForbidden()
     event = Event.objects.get(pk=e_pk)
     if event:
         if str(event.team_id.id) != str(pk):
@@ -131,9 +189,8 @@ def delete_event(request, pk, e_pk):
     return HttpResponseBadRequest()
 
 @login_required(login_url='user:signin')
+@perm_required(('D', 'N'))
 def delete_notice(request, pk, n_pk):
-    if not has_perm('D', 'N', request.user, pk):
-        return HttpResponseForbidden()
     notice = Notice.objects.get(pk=n_pk)
     if notice:
         if str(notice.team_id.id) != str(pk):
@@ -143,62 +200,286 @@ def delete_notice(request, pk, n_pk):
     return HttpResponseBadRequest()
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'C'))
+@team_conditional
 def timetable(request, pk):
-    if not has_perm('R', 'C', request.user, pk):
-        return HttpResponseForbidden()
-    classes = Class.objects.filter(team_id=pk).order_by('start_time')
+    def build():
+        classes = Class.objects.filter(team_id=pk).order_by('start_time')
+        return render_to_string('timetable_script.html', {
+            'classes': classes,
+            'days': Class.day.field.choices,
+            'team_id': pk,
+        }), FRAGMENT_TIMEOUT
     return render(request, 'timetable.html', {
-        'classes': classes, 
+        'timetable_script': cached_fragment('timetable', pk, resolve_perms(request.user, pk), build),
         'console': get_console_data(pk, request.user),
-        'days': Class.day.field.choices
     })
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'E'))
+@team_conditional
 def calendar(request, pk):
-    if not has_perm('R', 'E', request.user, pk):
-        return HttpResponseForbidden()
-    events = Event.objects.filter(team_id=pk).values('pk','start', 'end', 'title', 'description', 'team_id__id')
-    return render(request, 'calendar.html', {'events': events, 'console': get_console_data(pk, request.user)})
+    return render(request, 'calendar.html', {
+        'rollup': include_sub_teams(request),
+        'feed_token': feed_token(request.user, pk),
+        'console': get_console_data(pk, request.user)
+    })
+
+@login_required(login_url='user:signin')
+@perm_required(('R', 'E'))
+@team_conditional
+def calendar_events(request, pk):
+    window = parse_window(request)
+    if not window:
+        return HttpResponseBadRequest('Invalid start/end')
+    if include_sub_teams(request):
+        events = Event.objects.filter(team_id__in=rollup_teams('R', 'E', request.user, pk))
+        return JsonResponse([event_json(event) for event in events_in_window(events, *window)], safe=False)
+
+    def build():
+        return [event_json(event) for event in events_in_window(Event.objects.filter(team_id=pk), *window)], FRAGMENT_TIMEOUT
+    payload = cached_fragment('calendar', pk, resolve_perms(request.user, pk), build, variant=f'{window[0]:%Y%m%d%H%M}-{window[1]:%Y%m%d%H%M}')
+    return JsonResponse(payload, safe=False)
+
+@login_required(login_url='user:signin')
+@perm_required(('C', 'E'))
+def freebusy(request, pk):
+    # ?start=&end=&duration=<minutes>[&day_start=HH:MM&day_end=HH:MM]
+    window = parse_window(request)
+    if not window:
+        return HttpResponseBadRequest('Invalid start/end')
+    try:
+        duration = int(request.GET.get('duration', 60))
+        hours = [to_minutes(time.fromisoformat(request.GET[bound])) if request.GET.get(bound) else None for bound in ('day_start', 'day_end')]
+    except ValueError:
+        return HttpResponseBadRequest('Invalid duration or hours')
+    if not 0 < duration <= 24 * 60:
+        return HttpResponseBadRequest('Invalid duration or hours')
+    slots = free_slots(pk, *window, duration, *hours)
+    return JsonResponse({
+        'start': window[0].isoformat(),
+        'end': window[1].isoformat(),
+        'duration': duration,
+        'free': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in slots],
+    })
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'N'))
+@team_conditional_expiring
 def notice_board(request, pk):
-    if not has_perm('R', 'N', request.user, pk):
-        return HttpResponseForbidden()
-    notices = Notice.objects.filter(team_id=pk).values('pk','title', 'description', 'created_at')
-    return render(request, 'notice_board.html', {'notices': notices, 'console': get_console_data(pk, request.user)})
+    rollup = include_sub_teams(request)
+    perms = resolve_perms(request.user, pk)
+    cursor = None
+    if request.GET.get('before'):
+        cursor = parse_cursor(request.GET['before'])
+        if not cursor:
+            return HttpResponseBadRequest('Invalid cursor')
+
+    def build():
+        if rollup:
+            notices = Notice.objects.filter(team_id__in=rollup_teams('R', 'N', request.user, pk))
+        else:
+            notices = Notice.objects.filter(team_id=pk)
+        # Only live notices stay on the board, expired ones are in the
+        # archive. Pinned notices head the first page; the rest is paged
+        # newest first, so every live notice can be reached with "Older notices".
+        notices = notices.live().values('pk','title', 'description', 'created_at', 'pinned', 'expires_at', 'team_id__id', 'team_id__name')
+        pinned = [] if cursor else list(notices.filter(pinned=True).order_by('-created_at'))
+        page, next_cursor = keyset_page(notices.filter(pinned=False), cursor, size=ROLLUP_LIMIT if rollup else BOARD_LIMIT)
+        notices = pinned + page
+        html = render_to_string('notice_list.html', {'notices': notices, 'perms': perms, 'team_id': str(pk), 'next_cursor': next_cursor, 'rollup': rollup})
+        # Keep the fragment no longer than until the first shown notice expires.
+        expiries = [notice['expires_at'] for notice in notices if notice['expires_at']]
+        timeout = FRAGMENT_TIMEOUT
+        if expiries:
+            timeout = max(1, min(timeout, int((min(expiries) - timezone.now()).total_seconds())))
+        return html, timeout
+    # Only the first page of the team's own board is cached.
+    notice_list = build()[0] if rollup or cursor else cached_fragment('notices', pk, perms, build)
+    if not cursor:
+        mark_notices_seen(request.user, rollup_teams('R', 'N', request.user, pk) if rollup else [pk])
+    return render(request, 'notice_board.html', {'notice_list': notice_list, 'rollup': rollup, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'N'))
+@team_conditional_expiring
+def notice_archive(request, pk):
+    cursor = None
+    if request.GET.get('before'):
+        cursor = parse_cursor(request.GET['before'])
+        if not cursor:
+            return HttpResponseBadRequest('Invalid cursor')
+    notices = Notice.objects.filter(team_id=pk).expired().values('pk','title', 'description', 'created_at', 'expires_at')
+    notices, next_cursor = keyset_page(notices, cursor)
+    return render(request, 'notice_archive.html', {'notices': notices, 'next_cursor': next_cursor, 'console': get_console_data(pk, request.user)})
+
+@login_required(login_url='user:signin')
+@perm_required(('R', 'C'), ('U', 'C'), ('D', 'C'))
 def class_detail(request, pk, c_pk):
-    if not has_perm('R', 'C', request.user, pk) and not has_perm('U', 'C', request.user, pk) and not has_perm('D', 'C', request.user, pk):
-        return HttpResponseForbidden()
     class_ = get_object_or_404(Class, pk=c_pk)
     if str(class_.team_id.id) != str(pk):
         return HttpResponseBadRequest('Invalid request')
     return render(request, 'class_detail.html', {'class': class_, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'E'), ('U', 'E'), ('D', 'E'))
 def event_detail(request, pk, e_pk):
-    if not has_perm('R', 'E', request.user, pk) and not has_perm('U', 'E', request.user, pk) and not has_perm('D', 'E', request.user, pk):
-        return HttpResponseForbidden()
     event = get_object_or_404(Event, pk=e_pk)
     if str(event.team_id.id) != str(pk):
         return HttpResponseBadRequest('Invalid request')
     return render(request, 'event_detail.html', {'event': event, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
+@user_conditional
 def user_calendar(request, u_pk):
-    memberships = Membership.objects.filter(user_id=request.user.id)
-    teams = Team.objects.filter(membership__in=memberships)
-    events = Event.objects.filter(team_id__in=teams).values('pk','start', 'end', 'title', 'description', 'team_id__id')
-    return render(request, 'user_calendar.html', {
-        'events': events
-    })
+    return render(request, 'user_calendar.html', {'feed_token': feed_token(request.user)})
+
+@login_required(login_url='user:signin')
+@user_conditional
+def user_calendar_events(request, u_pk):
+    window = parse_window(request)
+    if not window:
+        return HttpResponseBadRequest('Invalid start/end')
+    events = Event.objects.filter(team_id__in=teams_with_perm('R', 'E', request.user))
+    payload = [event_json(event) for event in events_in_window(events, *window)]
+    payload += classes_in_window(weekly_schedule(request.user, user_state(request)), *window)
+    return JsonResponse(payload, safe=False)
 
+@login_required(login_url='user:signin')
+@user_conditional
 def user_bulletin(request):
-    mems = Membership.objects.filter(user_id=request.user).values_list('team_id', flat=True)
-    teams = Team.objects.filter(id__in=mems)
-    for team in teams:
-        if not has_perm('R', 'N', request.user, team.id):
-            teams = teams.exclude(id=team.id)
-    notices = Notice.objects.filter(team_id__in=teams).values('pk','title', 'description', 'created_at', 'team_id__name', 'team_id__id').order_by('-created_at')
-    return render(request, 'notice_feed.html', {'notices': notices})
+    cursor = None
+    if request.GET.get('before'):
+        cursor = parse_cursor(request.GET['before'])
+        if not cursor:
+            return HttpResponseBadRequest('Invalid cursor')
+    notices = Notice.objects.filter(team_id__in=teams_with_perm('R', 'N', request.user)).values('pk','title', 'description', 'created_at', 'team_id__name', 'team_id__id')
+    notices, next_cursor = keyset_page(notices, cursor)
+    if not cursor:
+        mark_notices_seen(request.user, teams_with_perm('R', 'N', request.user))
+    return render(request, 'notice_feed.html', {'notices': notices, 'next_cursor': next_cursor})
+
+# Async variants of the per-user views, routed instead of the sync ones when
+# settings.ASYNC_VIEWS is set (ASGI deployments); see sirius.utils.concurrent.
+
+@async_login_required(login_url='user:signin')
+@async_conditional(user_etag, user_last_modified)
+async def user_calendar_async(request, u_pk):
+    return await sync_to_async(render)(request, 'user_calendar.html', {'feed_token': feed_token(request.user)})
+
+@async_login_required(login_url='user:signin')
+@async_conditional(user_etag, user_last_modified)
+async def user_calendar_events_async(request, u_pk):
+    window = parse_window(request)
+    if not window:
+        return HttpResponseBadRequest('Invalid start/end')
+    events, schedule = await gather_reads(
+        lambda: events_in_window(Event.objects.filter(team_id__in=teams_with_perm('R', 'E', request.user)), *window),
+        lambda: weekly_schedule(request.user, user_state(request)),
+    )
+    payload = [event_json(event) for event in events] + classes_in_window(schedule, *window)
+    return JsonResponse(payload, safe=False)
+
+@async_login_required(login_url='user:signin')
+@async_conditional(user_etag, user_last_modified)
+async def user_bulletin_async(request):
+    cursor = None
+    if request.GET.get('before'):
+        cursor = parse_cursor(request.GET['before'])
+        if not cursor:
+            return HttpResponseBadRequest('Invalid cursor')
+    # teams_with_perm() may query (inherited roles), so it runs in the read too.
+    (notices, next_cursor), = await gather_reads(lambda: keyset_page(
+        Notice.objects.filter(team_id__in=teams_with_perm('R', 'N', request.user)).values('pk','title', 'description', 'created_at', 'team_id__name', 'team_id__id'),
+        cursor,
+    ))
+    if not cursor:
+        # A write, so not one of the gathered reads.
+        await sync_to_async(lambda: mark_notices_seen(request.user, teams_with_perm('R', 'N', request.user)))()
+    return await sync_to_async(render)(request, 'notice_feed.html', {'notices': notices, 'next_cursor': next_cursor})
+
+@login_required(login_url='user:signin')
+def search_sessions(request):
+    text = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 0)), 0)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+    results, has_next = [], False
+    if text and search_enabled():
+        notice_teams = [row['team_id'] for row in teams_with_perm('R', 'N', request.user)]
+        event_teams = [row['team_id'] for row in teams_with_perm('R', 'E', request.user)]
+        results, has_next = search(text, notice_teams, event_teams, page)
+        names = dict(Team.objects.filter(id__in={result['team_id'] for result in results}).values_list('id', 'name'))
+        for result in results:
+            result['team_name'] = names.get(result['team_id'])
+    return render(request, 'search.html', {
+        'q': text,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+        'enabled': search_enabled(),
+    })
+
+def feed_querysets(request, pk=None):
+    # (events, classes, teams) visible through the feed token, or None when
+    # the token is invalid. Memoised on the request since the conditional GET
+    # checks and the view both need it.
+    if not hasattr(request, '_feed_querysets'):
+        request._feed_querysets = None
+        token = read_feed_token(request.GET.get('token', ''), pk)
+        # Rotated tokens and deactivated users are refused; access to the
+        # teams themselves is checked below with the permissions of today.
+        user = get_user_model().objects.filter(pk=token[0], feed_generation=token[1], is_active=True).first() if token else None
+        if user and pk:
+            if has_perm('R', 'E', user, pk) and Team.objects.live().filter(id=pk).exists():
+                events = Event.objects.filter(team_id=pk)
+                classes = Class.objects.filter(team_id=pk) if has_perm('R', 'C', user, pk) else Class.objects.none()
+                request._feed_querysets = (events, classes, Team.objects.filter(id=pk))
+        elif user:
+            events = Event.objects.filter(team_id__in=teams_with_perm('R', 'E', user))
+            classes = Class.objects.filter(team_id__in=teams_with_perm('R', 'C', user))
+            request._feed_querysets = (events, classes, reachable_teams(user))
+        if request._feed_querysets and request.GET.get('classes') != '1':
+            request._feed_querysets = (request._feed_querysets[0], None, request._feed_querysets[2])
+    return request._feed_querysets
+
+def feed_state_for(request, pk=None):
+    if not hasattr(request, '_feed_state'):
+        querysets = feed_querysets(request, pk)
+        request._feed_state = feed_state(querysets[2], request.GET.urlencode()) if querysets else (None, None)
+    return request._feed_state
+
+def feed_etag(request, pk=None, u_pk=None):
+    return feed_state_for(request, pk)[0]
+
+def feed_last_modified(request, pk=None, u_pk=None):
+    return feed_state_for(request, pk)[1]
+
+@login_required(login_url='user:signin')
+def reset_feed_token(request):
+    # Revokes every calendar feed link the user has handed out.
+    if request.method == 'POST':
+        get_user_model().objects.filter(pk=request.user.pk).update(feed_generation=F('feed_generation') + 1)
+    next_url = request.POST.get('next', '')
+    if url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('user:calendar', u_pk=request.user.pk)
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def team_calendar_feed(request, pk):
+    querysets = feed_querysets(request, pk)
+    if not querysets:
+        return HttpResponseForbidden()
+    response = StreamingHttpResponse(stream_calendar(Team.objects.get(id=pk).name, *querysets[:2]), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+def user_calendar_feed(request, u_pk):
+    querysets = feed_querysets(request)
+    if not querysets:
+        return HttpResponseForbidden()
+    response = StreamingHttpResponse(stream_calendar('Sirius', *querysets[:2]), content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    return response
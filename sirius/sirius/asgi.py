@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sirius.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after the Django app is set up.
+from session.stream import STREAM_PATH, notice_stream
+
+
+async def application(scope, receive, send):
+    # Long-lived notice/event streams bypass the Django request cycle; see
+    # session/stream.py.
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await notice_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -101,6 +101,49 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Rendered team modules live in the 'fragments' cache and resolved permission
+# sets in 'permissions'. locmem is per process;
+# switch to 'django.core.cache.backends.filebased.FileBasedCache' with a
+# LOCATION directory to share entries and hit/miss counters between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    'permissions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'permissions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+
+# Async views
+# Route the dashboard, user calendar and bulletin to their async variants.
+# Only worth it under an ASGI server (sirius/asgi.py); under WSGI every async
+# view runs in an event loop of its own.
+
+ASYNC_VIEWS = False
+
+
+# Pub/sub
+# Delivers notice/event changes to the streams served by sirius/asgi.py. The
+# in-process broker only reaches streams held by the same ASGI process.
+
+PUBSUB_BACKEND = 'sirius.utils.pubsub.InProcessBroker'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -7,6 +7,7 @@ from . import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.landing, name='landing'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
     path("__reload__/", include("django_browser_reload.urls")),
     path('user/', include('user.urls')),
     path('team/', include('team.urls')),
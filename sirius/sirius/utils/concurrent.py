@@ -0,0 +1,70 @@
+import asyncio
+from calendar import timegm
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.shortcuts import resolve_url
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Helpers for the async views served under ASGI. Django 4.0 has no async ORM
+# methods yet, so each read runs in its own worker thread (and connection)
+# and independent reads are awaited together instead of one after another.
+
+
+def _read(func):
+    def run():
+        try:
+            return func()
+        finally:
+            # Worker threads are reused; honour CONN_MAX_AGE as a request would.
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def gather_reads(*funcs):
+    # Runs the callables concurrently and returns their results in order.
+    # Each one must fully evaluate its queryset (list(), .first(), ...).
+    return await asyncio.gather(*(_read(func) for func in funcs))
+
+
+def async_login_required(login_url):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # Resolving request.user reads the session and user rows.
+            if not await sync_to_async(lambda: request.user.is_authenticated)():
+                return redirect_to_login(request.get_full_path(), resolve_url(login_url))
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def async_conditional(etag_func, last_modified_func):
+    # Async counterpart of sirius.utils.conditional._conditional, taking the
+    # same validator functions. As with Django's condition(), the validators
+    # are checked first and the view only runs when the client's copy is
+    # stale, so a 304 never touches the content tables.
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # One read: both functions share the state memoised on the request.
+            (etag, last_modified), = await gather_reads(lambda: (
+                etag_func(request, *args, **kwargs),
+                last_modified_func(request, *args, **kwargs) if last_modified_func else None,
+            ))
+            etag = quote_etag(etag) if etag else None
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if request.method in ('GET', 'HEAD'):
+                    if etag and not response.has_header('ETag'):
+                        response.headers['ETag'] = etag
+                    if last_modified and not response.has_header('Last-Modified'):
+                        response.headers['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
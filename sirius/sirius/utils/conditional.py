@@ -0,0 +1,95 @@
+from hashlib import md5
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from team.models import Team
+from authorization.models import Membership
+from .perm import permission_stamp, reachable_teams
+
+# Conditional GET for read views. Validators are built from Team.content_version
+# (bumped by signals in team.apps), so a 304 costs one lookup on the team row
+# and never touches the session tables.
+
+
+def _viewer(request):
+    # The nav renders the viewer's name and the console their permissions,
+    # which may come from roles in ancestor teams whose changes do not move
+    # this team's version. Calendar pages embed the viewer's feed token.
+    user = request.user
+    return md5(f'{user.pk}:{user.first_name}:{user.last_name}:{user.email}:{getattr(user, "feed_generation", 0)}:{permission_stamp(user)}'.encode()).hexdigest()[:12]
+
+
+def _team_state(request, pk):
+    # The viewer's notice watermark is part of the state: the console shows
+    # an unread count, which changes when they read the board elsewhere.
+    if not hasattr(request, '_team_state'):
+        seen = Membership.objects.filter(team_id=OuterRef('pk'), user_id=request.user.pk).values('notices_seen_at')[:1]
+        request._team_state = Team.objects.filter(id=pk).annotate(seen=Subquery(seen)).values_list('content_version', 'content_updated_at', 'seen').first()
+    return request._team_state
+
+
+def teams_state(teams):
+    # {'teams', 'version', 'last'} of a set of teams. The version is a digest
+    # of the sorted (id, content_version) pairs rather than their sum, so
+    # swapping one team for another can never reproduce an earlier value.
+    rows = sorted(teams.values_list('id', 'content_version', 'content_updated_at'))
+    return {
+        'teams': len(rows),
+        'version': md5(repr([row[:2] for row in rows]).encode()).hexdigest()[:16],
+        'last': max((row[2] for row in rows), default=None),
+    }
+
+
+def user_state(request):
+    if not hasattr(request, '_user_state'):
+        request._user_state = teams_state(reachable_teams(request.user))
+    return request._user_state
+
+
+def team_etag(request, pk, **kwargs):
+    state = _team_state(request, pk)
+    if not state or request.GET.get('subteams') == '1':
+        # Rolled up pages also depend on sub-teams; always render them.
+        return None
+    seen = f'{state[2]:%Y%m%d%H%M%S%f}' if state[2] else ''
+    return f'{pk}-{state[0]}-{seen}-{_viewer(request)}-{md5(request.GET.urlencode().encode()).hexdigest()[:8]}'
+
+
+def team_last_modified(request, pk, **kwargs):
+    state = _team_state(request, pk)
+    if not state or request.GET.get('subteams') == '1':
+        return None
+    return state[1]
+
+
+def user_etag(request, **kwargs):
+    state = user_state(request)
+    return f'{state["teams"]}-{state["version"]}-{_viewer(request)}-{md5(request.GET.urlencode().encode()).hexdigest()[:8]}'
+
+
+def user_last_modified(request, **kwargs):
+    return user_state(request)['last']
+
+
+def minute_etag(etag_func):
+    # For content that also changes with the clock (notice expiry): the
+    # validator is only reused within the same minute.
+    def etag(request, *args, **kwargs):
+        value = etag_func(request, *args, **kwargs)
+        return value and f'{value}-{timezone.now():%Y%m%d%H%M}'
+    return etag
+
+
+def _conditional(etag_func, last_modified_func):
+    def decorator(view):
+        # no-cache makes browsers revalidate every time instead of reusing a
+        # heuristically fresh copy.
+        return cache_control(private=True, no_cache=True)(condition(etag_func=etag_func, last_modified_func=last_modified_func)(view))
+    return decorator
+
+
+team_conditional = _conditional(team_etag, team_last_modified)
+user_conditional = _conditional(user_etag, user_last_modified)
+# Last-Modified would let a client skip the minute bucket, so only the ETag is used.
+team_conditional_expiring = _conditional(minute_etag(team_etag), None)
@@ -1,18 +1,18 @@
+from django.shortcuts import get_object_or_404
 from team.models import Team
 from .perm import get_perms
+from session.utils import unread_notice_counts
 
 
 def get_console_data(team_id, user):
-    parents = []
-    team = Team.objects.get(id=team_id)
-    parent_id = team.parent_id.id if team.parent_id else None
-    while parent_id != None:
-        parent = Team.objects.values('name', 'id', 'parent_id__id').get(id=parent_id)
-        parents.append(parent)
-        parent_id = parent['parent_id__id']
-    parents.reverse()
+    team = get_object_or_404(Team.objects.live(), id=team_id)
+    parents = list(team.ancestors().values('name', 'id'))
+    perms = get_perms(user, team_id)
+    # No unread count (and no badge) in teams the viewer only reaches through
+    # an inherited role: read watermarks are kept per membership.
     return {
         'team': team, 
         'parents': parents, 
-        'perms': get_perms(user, team_id),
+        'perms': perms,
+        'unread': unread_notice_counts(user, [team.id]).get(team.id, 0) if 'R-N' in perms or user.is_superuser else 0,
     }
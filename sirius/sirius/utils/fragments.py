@@ -0,0 +1,68 @@
+import time
+from hashlib import md5
+from django.core.cache import caches
+
+# Cache alias for rendered team modules (timetable script, calendar payload,
+# notice list). Entries are keyed by team, a per-team generation and the
+# viewer's permission set; session/apps.py moves the generation on every
+# Class/Event/Notice save or delete, which orphans the old entries.
+FRAGMENT_CACHE = 'fragments'
+FRAGMENT_TIMEOUT = 60 * 60
+FRAGMENT_NAMES = ('timetable', 'calendar', 'notices')
+
+
+def _cache():
+    return caches[FRAGMENT_CACHE]
+
+
+def _generation(team_id):
+    # A timestamp instead of a counter: if the key is evicted the next value
+    # can never collide with a generation that still has entries cached.
+    key = f'fragment-gen:{team_id}'
+    generation = _cache().get(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not _cache().add(key, generation, None):
+            generation = _cache().get(key, generation)
+    return generation
+
+
+def invalidate_team_fragments(team_id):
+    _cache().set(f'fragment-gen:{team_id}', time.time_ns(), None)
+
+
+def _count(name, outcome):
+    key = f'fragment-stats:{name}:{outcome}'
+    if not _cache().add(key, 1, None):
+        try:
+            _cache().incr(key)
+        except ValueError:
+            _cache().set(key, 1, None)
+
+
+def cached_fragment(name, team_id, perms, build, variant=''):
+    # build() returns (value, timeout) and only runs on a miss.
+    perms_key = md5(','.join(sorted(perms)).encode()).hexdigest()[:12]
+    variant_key = md5(variant.encode()).hexdigest()[:12]
+    key = f'fragment:{name}:{team_id}:{_generation(team_id)}:{perms_key}:{variant_key}'
+    value = _cache().get(key)
+    if value is not None:
+        _count(name, 'hits')
+        return value
+    _count(name, 'misses')
+    value, timeout = build()
+    _cache().set(key, value, timeout)
+    return value
+
+
+def fragment_stats():
+    stats = {}
+    for name in FRAGMENT_NAMES:
+        hits = _cache().get(f'fragment-stats:{name}:hits', 0)
+        misses = _cache().get(f'fragment-stats:{name}:misses', 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return stats
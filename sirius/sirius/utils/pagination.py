@@ -0,0 +1,30 @@
+from datetime import datetime
+from django.db.models import Q
+
+PAGE_SIZE = 20
+
+
+def parse_cursor(cursor):
+    # Cursors look like "<iso timestamp>_<pk>"; returns None when malformed.
+    try:
+        timestamp, pk = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, field='created_at', size=PAGE_SIZE):
+    # Newest-first page of `queryset` (of .values() rows including 'pk' and
+    # `field`) strictly older than `cursor`. Seeks on (field, pk) instead of
+    # using OFFSET, so deep pages cost the same as the first one.
+    queryset = queryset.order_by('-' + field, '-pk')
+    if cursor:
+        value, pk = cursor
+        queryset = queryset.filter(Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+    rows = list(queryset[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        next_cursor = f"{last[field].isoformat()}_{last['pk']}"
+    return rows, next_cursor
@@ -1,41 +1,232 @@
-from signal import raise_signal
+import time
+import uuid
+from functools import wraps
+from types import MappingProxyType
+from django.core.cache import caches
+from django.db.models import F, Q, Subquery
 from authorization.models import Permission, Membership
+from team.models import PATH_SEP, Team, subtree_q
 from django.http import HttpResponseForbidden
 
+# Cache alias for effective permission masks, keyed by (user, team) and two
+# generations: the user's own (moved when their memberships or roles change,
+# or the tree changes around the teams they hold roles in) and a global one
+# (moved only by migrations).
+PERMISSION_CACHE = 'permissions'
+PERMISSION_TIMEOUT = 60 * 60
+USER_GENERATION = 'perm-gen:user:{}'
+GLOBAL_GENERATION = 'perm-gen:all'
+
+class PermissionCatalog:
+    # Read-only snapshot of the Permission table. The rows only change when
+    # the fixture is (re)loaded, so one copy per worker answers every lookup.
+    def __init__(self, permissions):
+        self.permissions = tuple(permissions)
+        self.codes = MappingProxyType({p.pk: p.action + '-' + p.relation for p in self.permissions})
+        self.pks = MappingProxyType({code: pk for pk, code in self.codes.items()})
+        self.all_mask = mask_from_pks(self.codes)
+
+    def codes_for_mask(self, mask):
+        return frozenset(self.codes[pk] for pk in pks_from_mask(mask) if pk in self.codes)
+
+    def pk_for(self, action, relation):
+        return self.pks.get(action + '-' + relation)
+
+_catalog = None
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = PermissionCatalog(Permission.objects.order_by('pk'))
+    return _catalog
+
+def reload_catalog(**kwargs):
+    # Connected to post_save/post_delete of Permission and post_migrate; the
+    # next get_catalog() call rebuilds the snapshot.
+    global _catalog
+    _catalog = None
+
+def mask_from_pks(pks):
+    mask = 0
+    for pk in pks:
+        if str(pk).isnumeric():
+            mask |= Permission.bit_for(pk)
+    return mask
+
+def pks_from_mask(mask):
+    return [bit + 1 for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+def _team_key(team):
+    return str(getattr(team, 'pk', team))
+
+def _perm_cache():
+    return caches[PERMISSION_CACHE]
+
+def _generations(user):
+    # Timestamps rather than counters, as in sirius.utils.fragments: an
+    # evicted generation can never come back with stale entries behind it.
+    keys = [USER_GENERATION.format(user.pk), GLOBAL_GENERATION]
+    generations = _perm_cache().get_many(keys)
+    for key in keys:
+        if key not in generations:
+            now = time.time_ns()
+            generations[key] = now if _perm_cache().add(key, now, None) else _perm_cache().get(key, now)
+    return [generations[key] for key in keys]
+
+def permission_stamp(user):
+    # Changes whenever the user's effective permissions may have, including
+    # through roles held in ancestor teams; part of the conditional GET state.
+    return '{:x}{:x}'.format(*_generations(user))
+
+def invalidate_user_perms(*user_ids):
+    _perm_cache().set_many({USER_GENERATION.format(user_id): time.time_ns() for user_id in user_ids}, None)
+
+def invalidate_all_perms(**kwargs):
+    _perm_cache().set(GLOBAL_GENERATION, time.time_ns(), None)
+
+def _invalidate_holders(memberships):
+    invalidate_user_perms(*set(memberships.values_list('user_id', flat=True)))
+
+def invalidate_member_perms(sender, instance, **kwargs):
+    invalidate_user_perms(instance.user_id_id)
+
+def invalidate_role_perms(sender, instance, created=False, **kwargs):
+    # Only the role's holders see its mask or inherited flag. Deleting a role
+    # deletes its memberships, whose own signals cover the holders.
+    if not created:
+        _invalidate_holders(Membership.objects.filter(role_id=instance.pk))
+
+def invalidate_team_perms(*team_ids):
+    # After memberships of the teams were moved with update().
+    _invalidate_holders(Membership.objects.filter(team_id__in=team_ids))
+
+def invalidate_tree_perms(*paths):
+    # Members of the subtrees at `paths` and holders of inherited roles in
+    # their ancestors: everyone whose masks may change when the subtrees
+    # move or are deleted.
+    reach = Q()
+    for path in paths:
+        ancestors = [uuid.UUID(part) for part in path.split(PATH_SEP)[:-2]]
+        reach |= Q(team_id__in=Team.objects.subtree(path).values('id')) | Q(team_id__in=ancestors, role_id__inherited=True)
+    _invalidate_holders(Membership.objects.filter(reach))
+
+def invalidate_moved_team_perms(sender, instance, created=False, **kwargs):
+    # Renames and version bumps leave the tree, and so every mask, as it was.
+    moved_from = getattr(instance, '_moved_from', None)
+    if moved_from and not created:
+        invalidate_tree_perms(moved_from, instance.path)
+
+def effective_mask(user, team):
+    # OR of the masks of the user's role in the team itself and of their
+    # inherited roles in its ancestors. One query: the memberships are
+    # matched against the team's materialized path, which starts with the
+    # path of every ancestor.
+    target = Team.objects.live().filter(id=team).values('path')
+    masks = Membership.objects.filter(user_id=user).annotate(target_path=Subquery(target)).filter(
+        Q(team_id=team) | Q(role_id__inherited=True),
+        target_path__startswith=F('team_id__path'),
+    ).values_list('role_id__permission_mask', flat=True)
+    mask = 0
+    for role_mask in masks:
+        mask |= role_mask
+    return mask
+
+def resolve_perms(user, team):
+    # Permission codes ('R-N', 'C-E', ...) the user holds in the team. The
+    # result is memoised on the user object, which lives for one request,
+    # and the mask behind it in the permissions cache across requests.
+    cache = getattr(user, '_team_perms', None)
+    if cache is None:
+        cache = {}
+        user._team_perms = cache
+    key = _team_key(team)
+    if key not in cache:
+        cache_key = 'perms:{}:{}:{}:{}'.format(user.pk, key, *_generations(user))
+        mask = _perm_cache().get(cache_key)
+        if mask is None:
+            mask = effective_mask(user, key)
+            _perm_cache().set(cache_key, mask, PERMISSION_TIMEOUT)
+        cache[key] = get_catalog().codes_for_mask(mask)
+    return cache[key]
+
 def has_perm(action, relation, user, team):
     if user.is_superuser:
         return True
-    permission = Permission.objects.get(action=action, relation=relation)
-    if permission:
-        permission = permission.pk
-    else:
-        return False
-    membership = Membership.objects.get(user_id=user, team_id=team)
-    if membership:
-        user_permissions = membership.role_id.permissions.strip(',').split(',')
-    if str(permission) in user_permissions:
+    return action + '-' + relation in resolve_perms(user, team)
+
+def has_any_perm(perms, user, team):
+    if user.is_superuser:
         return True
-    return False
+    user_perms = resolve_perms(user, team)
+    return any(action + '-' + relation in user_perms for action, relation in perms)
+
+def perm_required(*perms, team_kwarg='pk'):
+    # Usage: @perm_required(('R', 'C'), ('U', 'C')) -- the view is allowed if
+    # the user holds any one of the listed (action, relation) pairs.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not has_any_perm(perms, request.user, kwargs[team_kwarg]):
+                return HttpResponseForbidden()
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def _inherited_roots(user, grants, bit):
+    # Paths of the teams where the user holds the permission through an
+    # inherited role; usually none. Memoised on the request's user object.
+    cache = getattr(user, '_inherited_roots', None)
+    if cache is None:
+        cache = {}
+        user._inherited_roots = cache
+    if bit not in cache:
+        cache[bit] = list(grants.filter(role_id__inherited=True).values_list('team_id__path', flat=True))
+    return cache[bit]
+
+def reachable_teams(user):
+    # Live teams the user is a member of or reaches through an inherited
+    # role, whatever the permissions: the team set user-level pages and
+    # caches are versioned by.
+    memberships = Membership.objects.filter(user_id=user, team_id__deleted_at__isnull=True)
+    reach = Q(id__in=memberships.values('team_id'))
+    for path in memberships.filter(role_id__inherited=True).values_list('team_id__path', flat=True):
+        reach |= subtree_q(path)
+    return Team.objects.live().filter(reach)
+
+def teams_with_perm(action, relation, user, teams=None):
+    # Ids of the teams in `teams` (default: the user's own teams and the
+    # sub-teams their inherited roles reach) where the user holds the
+    # permission, as a lazy queryset usable as a subquery.
+    if user.is_superuser and teams is not None:
+        return Team.objects.live().filter(id__in=teams).values('id')
+    memberships = Membership.objects.filter(user_id=user, team_id__deleted_at__isnull=True)
+    if user.is_superuser:
+        return memberships.values('team_id')
+    bit = Permission.bit_for(get_catalog().pk_for(action, relation))
+    grants = memberships.annotate(granted_bit=F('role_id__permission_mask').bitand(bit)).filter(granted_bit=bit)
+    roots = _inherited_roots(user, grants, bit)
+    if teams is not None:
+        grants = grants.filter(team_id__in=teams)
+    if not roots:
+        return grants.values('team_id')
+    # Direct grants plus one path range (an index range scan) per root.
+    reach = Q(id__in=grants.values('team_id'))
+    for path in roots:
+        reach |= subtree_q(path)
+    candidates = Team.objects.live().filter(reach)
+    if teams is not None:
+        candidates = candidates.filter(id__in=teams)
+    return candidates.values(team_id=F('id'))
 
 def get_perms(user, team):
-    perms = []
-    if team:
-        user_permissions = Membership.objects.get(user_id=user, team_id=team).role_id.permissions.strip(',').split(',')
-        for permission in user_permissions:
-            if permission:
-                perm = Permission.objects.get(pk=permission)
-                perms.append(perm.action + '-' + perm.relation)
-    return perms
+    if not team:
+        return []
+    return list(resolve_perms(user, team))
 
 def display_perms(roles):
     perms_dict = {}
     for role in roles:
-        perms_list = []
-        perms = role['permissions'].strip(',').split(',')
-        for permission in perms:
-            if permission.isnumeric():
-                perms_list.append(int(permission))
-        perms_dict[int(role['pk'])] = perms_list
+        perms_dict[int(role['pk'])] = pks_from_mask(role['permission_mask'])
     return perms_dict
 
 # def permList(perms):
@@ -44,4 +235,4 @@ def display_perms(roles):
 #         if permission:
 #             perm = Permission.objects.get(pk=permission)
 #             perms.append(perm.action + '-' + perm.relation)
-#     return perms
\ No newline at end of file
+#     return perms
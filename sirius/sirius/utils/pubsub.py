@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Publish/subscribe between the code that saves notices/events (sync, any
+# thread) and the open event streams (asyncio tasks in the ASGI process).
+# settings.PUBSUB_BACKEND names the broker class; a broker backed by Redis or
+# another external service only needs the same subscribe()/publish() pair.
+
+DEFAULT_BACKEND = 'sirius.utils.pubsub.InProcessBroker'
+# Messages kept for a subscriber that is not reading; older ones are dropped.
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    # Reaches subscribers in this process only: run a single ASGI worker, or
+    # swap in an external broker when there are several.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, channels):
+        # Must be called from the event loop the subscription is read on.
+        subscription = Subscription(self, channels)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+    def publish(self, channel, message):
+        # Safe to call from any thread; each delivery is handed to the loop
+        # that owns the subscription.
+        with self.lock:
+            subscriptions = list(self.subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            if not subscription.loop.is_closed():
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'PUBSUB_BACKEND', DEFAULT_BACKEND))()
+    return _broker
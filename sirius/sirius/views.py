@@ -1,6 +1,15 @@
 from django.shortcuts import render, redirect
+from django.http import HttpResponseForbidden, JsonResponse
+from django.contrib.auth.decorators import login_required
+from sirius.utils.fragments import fragment_stats
 
 def landing(request):
     if request.user.is_authenticated:
         return redirect('user:dashboard', u_pk=request.user.pk)
-    return render(request, 'landing.html', {})
\ No newline at end of file
+    return render(request, 'landing.html', {})
+
+@login_required(login_url='user:signin')
+def cache_stats(request):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden()
+    return JsonResponse(fragment_stats())
\ No newline at end of file
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Team, JoinRequest, Invite
+from .models import Team, JoinRequest, Invite, TeamDeletion
 
 # Register your models here.
 admin.site.register(Team)
 admin.site.register(JoinRequest)
-admin.site.register(Invite)
\ No newline at end of file
+admin.site.register(Invite)
+admin.site.register(TeamDeletion)
\ No newline at end of file
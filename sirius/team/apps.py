@@ -1,6 +1,63 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+# Models whose changes invalidate the rendered content of their team.
+VERSIONED_MODELS = (
+    'session.Class',
+    'session.Event',
+    'session.Notice',
+    'authorization.Membership',
+)
+
+
+def build_team_paths(sender, **kwargs):
+    # Backfills Team.path for teams created before the column existed.
+    from .models import Team, PATH_SEP
+    if not Team.objects.filter(path='').exists():
+        return
+    teams = {team.id: team for team in Team.objects.only('id', 'parent_id', 'path')}
+
+    def path_of(team):
+        if not team.path:
+            parent = teams.get(team.parent_id_id)
+            team.path = (path_of(parent) if parent else '') + team.id.hex + PATH_SEP
+        return team.path
+
+    for team in teams.values():
+        path_of(team)
+    Team.objects.bulk_update(teams.values(), ['path'], batch_size=500)
+
+
+def bump_team_version(sender, instance, **kwargs):
+    from .models import Team
+    Team.bump_version(instance.team_id_id)
+
+
+def bump_role_version(sender, instance, **kwargs):
+    # A role's mask or inherited flag decides what its members see in every
+    # sub-team it reaches, so the whole subtree moves.
+    from .models import Team
+    path = Team.objects.filter(id=instance.team_id_id).values_list('path', flat=True).first()
+    if path:
+        Team.bump_subtree_version(path)
+
+
+def bump_parent_version(sender, instance, **kwargs):
+    # A sub-team being added, renamed or removed changes the parent's info page.
+    from .models import Team
+    Team.bump_version(instance.pk, instance.parent_id_id)
 
 
 class TeamConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'team'
+
+    def ready(self):
+        post_migrate.connect(build_team_paths, sender=self)
+        for model in VERSIONED_MODELS:
+            post_save.connect(bump_team_version, sender=model)
+            post_delete.connect(bump_team_version, sender=model)
+        post_save.connect(bump_role_version, sender='authorization.Role')
+        post_delete.connect(bump_role_version, sender='authorization.Role')
+        post_save.connect(bump_parent_version, sender='team.Team')
+        post_delete.connect(bump_parent_version, sender='team.Team')
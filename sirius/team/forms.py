@@ -34,7 +34,7 @@ class JoinRequestForm(forms.ModelForm):
 
     def clean_team_id(self):
         team_id = self.cleaned_data.get('team_id')
-        if not Team.objects.filter(id=team_id).exists():
+        if not Team.objects.live().filter(id=team_id).exists():
             raise forms.ValidationError('Invalid id')
         team = Team.objects.get(id=team_id)
         return team
@@ -48,4 +48,18 @@ class JoinRequestForm(forms.ModelForm):
             raise forms.ValidationError('A request is already pending')
         
 
-        
\ No newline at end of file
+        
+
+class BulkInviteForm(forms.Form):
+    emails = forms.CharField(widget=forms.Textarea, required=False, help_text='One email per line, or separated by commas')
+    file = forms.FileField(required=False, help_text='Or a .csv/.txt file of emails')
+
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if file and not file.name.lower().endswith(('.csv', '.txt')):
+            raise forms.ValidationError('Upload a .csv or .txt file')
+        return file
+
+    def clean(self):
+        if not self.cleaned_data.get('emails') and not self.cleaned_data.get('file'):
+            raise forms.ValidationError('Paste some emails or upload a file')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from team.models import TeamDeletion
+from team.purge import PURGE_CHUNK, PURGE_PAUSE, purge
+
+# Finishes team deletions whose background purge did not complete (e.g. the
+# server was restarted mid-way). Safe to run while purges are in progress
+# elsewhere: chunks are re-read before each delete.
+
+
+class Command(BaseCommand):
+    help = 'Purge the rows of deleted teams that are still pending.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=PURGE_CHUNK, help='Rows deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=PURGE_PAUSE, help='Seconds slept between chunks.')
+
+    def handle(self, *args, **options):
+        for deletion in TeamDeletion.objects.filter(finished_at__isnull=True).order_by('created_at'):
+            self.stdout.write(f'Purging {deletion.name} ({deletion.purged}/{deletion.total})')
+            purge(deletion, options['chunk'], options['pause'])
+            deletion.refresh_from_db()
+            self.stdout.write(self.style.SUCCESS(f'  done, {deletion.purged} rows'))
@@ -1,7 +1,27 @@
 from django.db import models
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 import uuid
 
+# Materialized path separator. It sorts before every hex digit, so the subtree
+# of "<path>" is exactly the index range [<path>, <path minus "/"> + "0").
+PATH_SEP = '/'
+
+def subtree_q(path):
+    # Index range of the teams at or below `path`.
+    return models.Q(path__gte=path, path__lt=path[:-1] + chr(ord(PATH_SEP) + 1))
+
+class TeamQuerySet(models.QuerySet):
+    def subtree(self, path, include_self=True):
+        qs = self.filter(subtree_q(path))
+        if not include_self:
+            qs = qs.exclude(path=path)
+        return qs
+
+    def live(self):
+        return self.filter(deleted_at__isnull=True)
+
 class Team(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200)
@@ -9,9 +29,61 @@ class Team(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     description = models.TextField()
     parent_id = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    # Hex ids of every ancestor and the team itself, root first, e.g. "<root>/<child>/".
+    path = models.CharField(max_length=2000, db_index=True, editable=False, default='')
+    # Bumped whenever sessions, memberships or roles of the team (or roles of
+    # an ancestor) change; read views derive their ETag/Last-Modified from it.
+    content_version = models.PositiveIntegerField(default=0, editable=False)
+    content_updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Set on the whole subtree when it is deleted; the rows are purged in the
+    # background afterwards (team/purge.py) and hidden until then.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = TeamQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = self.parent_id.path if self.parent_id else ''
+        if old_path and parent_path.startswith(old_path):
+            raise ValueError('A team cannot be moved under its own sub-team')
+        self.path = parent_path + self.id.hex + PATH_SEP
+        # Read by the post_save receivers: only a move changes permissions.
+        self._moved_from = old_path if old_path and old_path != self.path else None
+        super().save(*args, **kwargs)
+        if old_path and old_path != self.path:
+            Team.objects.subtree(old_path, include_self=False).update(
+                path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1))
+            )
+
+    @staticmethod
+    def bump_version(*team_ids):
+        Team.objects.filter(id__in=[team_id for team_id in team_ids if team_id]).update(
+            content_version=models.F('content_version') + 1,
+            content_updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def bump_subtree_version(path):
+        Team.objects.subtree(path).update(
+            content_version=models.F('content_version') + 1,
+            content_updated_at=timezone.now(),
+        )
+
+    def ancestor_ids(self):
+        return [uuid.UUID(part) for part in self.path.split(PATH_SEP)[:-2]]
+
+    def ancestors(self):
+        return Team.objects.filter(id__in=self.ancestor_ids()).order_by('path')
+
+    def descendants(self, include_self=False):
+        return Team.objects.subtree(self.path, include_self=include_self)
+
+    def is_descendant_of(self, other):
+        return self.path != other.path and self.path.startswith(other.path)
+
 class JoinRequest(models.Model):
     STATUS_CHOICES = (
         ('P', 'Pending'),
@@ -42,3 +114,24 @@ class Invite(models.Model):
 
     def __str__(self):
         return self.user_id.username
+
+class TeamDeletion(models.Model):
+    # Progress of a background subtree purge. Outlives the team, so the
+    # team is kept by id, name and path rather than a foreign key.
+    team_id = models.UUIDField()
+    name = models.CharField(max_length=200)
+    path = models.CharField(max_length=2000)
+    requested_by = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    total = models.PositiveIntegerField(default=0)
+    purged = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def percent(self):
+        if self.finished_at:
+            return 100
+        return min(99, self.purged * 100 // self.total) if self.total else 0
@@ -0,0 +1,92 @@
+import threading
+import time
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+from django.utils import timezone
+from authorization.models import Membership, Role
+from session.models import Class, Event, Notice
+from session.search import KINDS, unindex_sessions
+from sirius.utils.perm import invalidate_tree_perms
+from .models import Team, Invite, JoinRequest, TeamDeletion
+
+# Deleting a team subtree in two phases. mark_deleted() hides the whole
+# subtree with one UPDATE; purge() then removes its rows in short
+# transactions of PURGE_CHUNK rows each, so SQLite writers are never blocked
+# for long and nothing is loaded into memory beyond one chunk of pks. The
+# rows are deleted with plain DELETE statements: Django's collector would
+# fetch every row to run the per-row signals, which only move caches of
+# teams that are already hidden.
+
+PURGE_CHUNK = 500
+# Seconds slept between chunks, leaving the database to other writers.
+PURGE_PAUSE = 0.05
+# Children before parents: sessions, invitations and memberships reference
+# roles and teams, and the teams themselves go last.
+PURGE_MODELS = (Notice, Event, Class, Invite, JoinRequest, Membership, Role)
+
+
+def _subtree(deletion):
+    return Team.objects.subtree(deletion.path).filter(deleted_at__isnull=False)
+
+
+def mark_deleted(team, user):
+    now = timezone.now()
+    with transaction.atomic():
+        Team.objects.subtree(team.path).live().update(deleted_at=now)
+        deletion = TeamDeletion.objects.create(team_id=team.id, name=team.name, path=team.path, requested_by=user)
+        teams = _subtree(deletion).values('id')
+        deletion.total = sum(model.objects.filter(team_id__in=teams).count() for model in PURGE_MODELS) + teams.count()
+        deletion.save(update_fields=['total'])
+    Team.bump_version(team.parent_id_id)
+    invalidate_tree_perms(team.path)
+    return deletion
+
+
+def _delete_rows(model, pks):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} WHERE {connection.ops.quote_name(model._meta.pk.column)} IN ({", ".join(["%s"] * len(pks))})',
+            [model._meta.pk.get_db_prep_value(pk, connection) for pk in pks],
+        )
+    kind = KINDS.get(model._meta.model_name)
+    if kind:
+        unindex_sessions(kind, pks)
+
+
+def _chunks(deletion, size):
+    # Yields (model, pks) until the subtree is gone, re-reading after each
+    # chunk so rows added meanwhile are picked up too.
+    teams = _subtree(deletion).values('id')
+    for model in PURGE_MODELS:
+        while pks := list(model.objects.filter(team_id__in=teams).values_list('pk', flat=True)[:size]):
+            yield model, pks
+    # Deepest teams first, so no chunk removes a parent before its children.
+    while pks := list(_subtree(deletion).order_by(-Length('path')).values_list('pk', flat=True)[:size]):
+        yield Team, pks
+
+
+def purge(deletion, size=PURGE_CHUNK, pause=PURGE_PAUSE):
+    for model, pks in _chunks(deletion, size):
+        with transaction.atomic():
+            _delete_rows(model, pks)
+            TeamDeletion.objects.filter(pk=deletion.pk).update(purged=F('purged') + len(pks))
+        if pause:
+            time.sleep(pause)
+    # mark_deleted() already moved the masks of everyone the subtree concerned.
+    TeamDeletion.objects.filter(pk=deletion.pk).update(finished_at=timezone.now())
+
+
+def _run(deletion_pk):
+    try:
+        purge(TeamDeletion.objects.get(pk=deletion_pk))
+    finally:
+        close_old_connections()
+        connection.close()
+
+
+def start_purge(deletion):
+    # No task queue in this project: the purge runs in a daemon thread once
+    # the marking is committed. An interrupted purge is picked up again by
+    # `manage.py purge_teams`.
+    transaction.on_commit(lambda: threading.Thread(target=_run, args=(deletion.pk,), daemon=True).start())
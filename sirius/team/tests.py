@@ -1,3 +1,145 @@
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from authorization.models import Membership, Role
+from session.models import Event, Notice
+from session.search import search
+from team import purge
+from team.models import Invite, Team, TeamDeletion
+from team.utils import init_roles
 
 # Create your tests here.
+class TeamPathTests(TestCase):
+    def setUp(self):
+        self.root = Team.objects.create(name='Root', description='')
+        self.child = Team.objects.create(name='Child', description='', parent_id=self.root)
+        self.leaf = Team.objects.create(name='Leaf', description='', parent_id=self.child)
+        self.other = Team.objects.create(name='Other', description='')
+
+    def test_path_lists_ancestors(self):
+        self.assertEqual(self.leaf.path, f'{self.root.id.hex}/{self.child.id.hex}/{self.leaf.id.hex}/')
+        self.assertEqual(list(self.leaf.ancestors()), [self.root, self.child])
+        self.assertEqual(set(self.root.descendants()), {self.child, self.leaf})
+
+    def test_moving_subtree_rewrites_paths(self):
+        self.child.parent_id = self.other
+        self.child.save()
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'{self.other.id.hex}/{self.child.id.hex}/{self.leaf.id.hex}/')
+        self.assertEqual(list(self.leaf.ancestors()), [self.other, self.child])
+        self.assertEqual(list(self.root.descendants()), [])
+        self.assertEqual(set(self.other.descendants()), {self.child, self.leaf})
+
+    def test_cannot_move_under_own_subtree(self):
+        self.root.parent_id = self.leaf
+        with self.assertRaises(ValueError):
+            self.root.save()
+        self.child.refresh_from_db()
+        self.assertTrue(self.child.path.startswith(self.root.path))
+
+
+class TeamPurgeTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='pw', username='user')
+        self.parent = Team.objects.create(name='Parent', description='')
+        self.root = Team.objects.create(name='Root', description='', parent_id=self.parent)
+        child = Team.objects.create(name='Child', description='', parent_id=self.root)
+        leaf = Team.objects.create(name='Leaf', description='', parent_id=child)
+        self.subtree = [self.root, child, leaf]
+        for team in [self.parent] + self.subtree:
+            init_roles(team, self.user)
+            Notice.objects.create(title=f'Notice of {team.name}', team_id=team, user_id=self.user)
+            Event.objects.create(title=f'Event of {team.name}', team_id=team, start=datetime(2024, 1, 1, 9), end=datetime(2024, 1, 1, 10))
+        self.deletion = purge.mark_deleted(self.root, self.user)
+        self.calls = []
+
+    def record(self, model, pks):
+        self.calls.append((model, list(pks)))
+        self.real_delete(model, pks)
+
+    def run_purge(self, side_effect):
+        self.real_delete = purge._delete_rows
+        with mock.patch('team.purge._delete_rows', side_effect=side_effect):
+            purge.purge(self.deletion, size=2, pause=0)
+
+    def assert_purged(self):
+        self.deletion.refresh_from_db()
+        self.assertIsNotNone(self.deletion.finished_at)
+        self.assertEqual(self.deletion.purged, self.deletion.total)
+        self.assertEqual(list(Team.objects.all()), [self.parent])
+        for model in (Notice, Event, Membership, Role):
+            self.assertFalse(model.objects.exclude(team_id=self.parent).exists())
+        self.assertEqual([row['team_id'] for row in search('notice', [team.id for team in [self.parent] + self.subtree], [])[0]], [self.parent.id])
+
+    def test_subtree_hidden_at_once(self):
+        self.assertEqual(list(Team.objects.live()), [self.parent])
+        # Per team: a notice, an event, two roles and a membership, plus the team.
+        self.assertEqual(self.deletion.total, 3 * 6)
+        self.assertEqual(self.deletion.percent, 0)
+
+    def test_deleted_teams_leave_the_views(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('team:team_info', kwargs={'pk': self.parent.pk}))
+        self.assertEqual(list(response.context['children']), [])
+        invited = get_user_model().objects.create_user(email='invited@example.com', password='pw', username='invited')
+        invite = Invite.objects.create(team_id=self.root, created_by=self.user, invited=invited)
+        for name in ('team:accept_invite', 'team:decline_invite'):
+            self.assertEqual(self.client.post(reverse(name, kwargs={'pk': invite.pk})).status_code, 404)
+        self.assertFalse(Membership.objects.filter(user_id=invited).exists())
+
+    def test_chunks_go_children_first(self):
+        self.run_purge(self.record)
+        order = [model for model, _ in self.calls]
+        self.assertEqual(sorted(order, key=lambda model: (purge.PURGE_MODELS + (Team,)).index(model)), order)
+        self.assertTrue(all(len(pks) <= 2 for _, pks in self.calls))
+        teams = [pk for model, pks in self.calls if model is Team for pk in pks]
+        self.assertEqual(teams, [team.pk for team in reversed(self.subtree)])
+        self.assert_purged()
+
+    def test_resume_after_crash(self):
+        def crash(model, pks):
+            if len(self.calls) == 3:
+                raise RuntimeError('worker died')
+            self.record(model, pks)
+        with self.assertRaises(RuntimeError):
+            self.run_purge(crash)
+        self.deletion.refresh_from_db()
+        self.assertEqual(self.deletion.purged, 5)
+        self.assertIsNone(self.deletion.finished_at)
+        self.assertEqual(Team.objects.subtree(self.root.path).count(), 3)
+        call_command('purge_teams', chunk=2, pause=0, stdout=StringIO())
+        self.assert_purged()
+        self.assertFalse(TeamDeletion.objects.filter(finished_at__isnull=True).exists())
+
+
+class BulkInviteTests(TestCase):
+    fixtures = ['permissions']
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='admin@example.com', password='pw', username='admin')
+        for name in ('ann', 'bob'):
+            User.objects.create_user(email=f'{name}@example.com', password='pw', username=name)
+        self.team = Team.objects.create(name='Team', description='')
+        init_roles(self.team, self.user)
+        self.client.force_login(self.user)
+
+    def test_results_name_their_source(self):
+        upload = SimpleUploadedFile('emails.csv', b'name,email\nBob,bob@example.com\nAnn,ANN@example.com\n')
+        response = self.client.post(reverse('team:send_bulk_invite', kwargs={'pk': self.team.pk}), {'emails': 'ann@example.com\nnobody', 'file': upload})
+        self.assertEqual(response.context['created'], 2)
+        self.assertEqual(response.context['results'], [
+            ('Pasted list', 1, 'ann@example.com', 'Invited'),
+            ('Pasted list', 2, 'nobody', 'Invalid email'),
+            ('File', 2, 'bob@example.com', 'Invited'),
+            ('File', 3, 'ANN@example.com', 'Duplicate in list'),
+        ])
@@ -9,6 +9,7 @@ urlpatterns = [
     path('<pk>/new-team/', create_sub_team, name='create_sub_team'),
     path('<pk>/info/', team_info, name='team_info'),
     path('<pk>/send-invite/<user>/', send_invite, name='send_invite'),
+    path('<pk>/bulk-invite/', send_bulk_invite, name='send_bulk_invite'),
     path('send-join-request/', send_join_request, name='send_join_request'),
     path('<pk>/invites/', invites, name='invites'),
     path('<pk>/join-requests/', join_requests, name='join_requests'),
@@ -19,5 +20,6 @@ urlpatterns = [
     path('leave-team/<pk>/', leave_team, name='leave_team'),
     path('decline-join-request/<pk>/', decline_join_request, name='decline_join_request'),
     path('<pk>/delete', delete_team, name='delete_team'),
+    path('deletions/<d_pk>/', deletion, name='deletion'),
     path('<pk>/', include('session.urls', namespace="session"))
 ]
\ No newline at end of file
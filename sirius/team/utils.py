@@ -1,15 +1,84 @@
-from authorization.models import Role, Permission, Membership
+import csv
+import re
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from authorization.models import Role, Membership
+from sirius.utils.perm import mask_from_pks, get_catalog
+from .models import Invite
+
+MEMBER_PERMISSIONS = (6, 21, 14, 2, 18)
 
 def init_roles(team, user):
-    admin_role = Role.objects.create(role_name='Admin', team_id=team, role_description='Admin')
-    admin_permissions = Permission.objects.all().values('pk')
-    permission_string = ""
-    for permission in admin_permissions:
-        permission_string += str(permission['pk']) + ","
-    admin_role.permissions = permission_string
-    admin_role.save()
-    member_role = Role.objects.create(role_name='Member', team_id=team, role_description='Member')
-    member_permissions = "6,21,14,2,18"
-    member_role.permissions = member_permissions
-    member_role.save()
-    Membership.objects.create(user_id=user, team_id=team, role_id=admin_role)
\ No newline at end of file
+    admin_role = Role.objects.create(role_name='Admin', team_id=team, role_description='Admin', permission_mask=get_catalog().all_mask)
+    Role.objects.create(role_name='Member', team_id=team, role_description='Member', permission_mask=mask_from_pks(MEMBER_PERMISSIONS))
+    Membership.objects.create(user_id=user, team_id=team, role_id=admin_role)
+
+# Separators accepted in a pasted or uploaded email list (CSV cells included).
+EMAIL_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def parse_emails(text):
+    # [(line, email)] in input order. A CSV with an "email" header column is
+    # read by that column; anything else is split on EMAIL_SEPARATORS.
+    lines = text.splitlines()
+    header = next(csv.reader(lines[:1]), [])
+    columns = [cell.strip().lower() for cell in header]
+    entries = []
+    if 'email' in columns:
+        column = columns.index('email')
+        for line, row in enumerate(csv.reader(lines[1:]), start=2):
+            if len(row) > column and row[column].strip():
+                entries.append((line, row[column].strip()))
+        return entries
+    for line, row in enumerate(lines, start=1):
+        for value in EMAIL_SEPARATORS.split(row):
+            value = value.strip('"\'<>')
+            if value:
+                entries.append((line, value))
+    return entries
+
+
+def bulk_invite(team_pk, created_by, entries):
+    # Invites every valid email in `entries` ((source, line, email) triples,
+    # source naming the input the line belongs to) to the team. Users,
+    # memberships and pending invites are each resolved with one query over
+    # the whole list and the new invites written with one bulk_create.
+    # Returns (created, [(source, line, email, outcome)]) in input order.
+    results, wanted = [], {}
+    for position, (source, line, email) in enumerate(entries):
+        key = email.lower()
+        try:
+            validate_email(email)
+        except ValidationError:
+            results.append((position, source, line, email, 'Invalid email'))
+            continue
+        if key in wanted:
+            results.append((position, source, line, email, 'Duplicate in list'))
+            continue
+        wanted[key] = (position, source, line, email)
+    users = dict(
+        get_user_model().objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=wanted).values_list('email_lower', 'pk')
+    )
+    members = set(Membership.objects.filter(team_id=team_pk, user_id__in=users.values()).values_list('user_id', flat=True))
+    pending = set(Invite.objects.filter(status='P', team_id=team_pk, invited__in=users.values()).values_list('invited', flat=True))
+    invites = []
+    for key, entry in wanted.items():
+        user = users.get(key)
+        if user is None:
+            outcome = 'No user with this email'
+        elif user in members:
+            outcome = 'Already a member'
+        elif user in pending:
+            outcome = 'Already invited'
+        else:
+            invites.append(Invite(team_id_id=team_pk, created_by=created_by, invited_id=user))
+            outcome = 'Invited'
+        results.append((*entry, outcome))
+    with transaction.atomic():
+        Invite.objects.bulk_create(invites, batch_size=500)
+    results.sort(key=lambda result: result[0])
+    return len(invites), [result[1:] for result in results]
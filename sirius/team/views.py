@@ -1,14 +1,16 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.http import Http404, HttpResponseForbidden
+from django.http import Http404, HttpResponseForbidden, JsonResponse
 
-from team.models import Team, JoinRequest, Invite
-from .forms import TeamCreationForm, JoinRequestForm
+from team.models import Team, JoinRequest, Invite, TeamDeletion
+from .forms import TeamCreationForm, JoinRequestForm, BulkInviteForm
 from authorization.models import Membership, Permission, Role
-from sirius.utils.perm import get_perms, has_perm
+from sirius.utils.perm import get_perms, has_perm, perm_required
 from sirius.utils.console_context import get_console_data
-from .utils import init_roles
+from sirius.utils.conditional import team_conditional
+from .utils import init_roles, parse_emails, bulk_invite
+from .purge import mark_deleted, start_purge
 
 @login_required(login_url='user:signin')
 def create_team(request):
@@ -32,7 +34,7 @@ def create_sub_team(request, pk):
                 if not has_perm('C', 'T', request.user, form.cleaned_data.get('parent_id')):
                     return HttpResponseForbidden()
             team = form.save(commit=False)
-            if Team.objects.filter(id=pk).count() == 0:
+            if Team.objects.live().filter(id=pk).count() == 0:
                 raise form.ValidationError("Parent team does not exist")
             if not has_perm('C', 'T', request.user, pk):
                 return HttpResponseForbidden()
@@ -47,9 +49,10 @@ def create_sub_team(request, pk):
     return render(request, 'create_sub_team.html', {'form': form, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
+@team_conditional
 def team_info(request, pk):
     members = Membership.objects.filter(team_id=pk).values('created_at', 'alumni', 'user_id__pk', 'user_id__first_name', 'user_id__last_name', 'user_id__username', 'role_id__pk', 'role_id__role_name')
-    children = Team.objects.filter(parent_id=pk).values('name', 'id')
+    children = Team.objects.live().filter(parent_id=pk).values('name', 'id')
     return render(request, 'team_info.html', {
         'members': members,
         'children': children,
@@ -68,6 +71,26 @@ def send_invite(request, pk, user):
         return redirect('team:team_info', pk=pk)
     return redirect('team:team_info', pk=pk)
 
+@login_required(login_url='user:signin')
+@perm_required(('C', 'I'))
+def send_bulk_invite(request, pk):
+    created, results = None, []
+    if request.method == 'POST':
+        form = BulkInviteForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Both inputs number their lines from 1, so results name their source.
+            entries = [('Pasted list', line, email) for line, email in parse_emails(form.cleaned_data['emails'])]
+            if form.cleaned_data['file']:
+                try:
+                    entries += [('File', line, email) for line, email in parse_emails(form.cleaned_data['file'].read().decode('utf-8-sig'))]
+                except UnicodeDecodeError as e:
+                    form.add_error('file', f'Could not read file: {e}')
+            if form.is_valid():
+                created, results = bulk_invite(pk, request.user, entries)
+    else:
+        form = BulkInviteForm()
+    return render(request, 'bulk_invite.html', {'form': form, 'created': created, 'results': results, 'console': get_console_data(pk, request.user)})
+
 @login_required(login_url='user:signin')
 def send_join_request(request):
     if request.method == 'POST':
@@ -79,23 +102,23 @@ def send_join_request(request):
     return redirect('user:dashboard', u_pk=request.user.pk)
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'I'))
 def invites(request, pk):
-    if not has_perm('R', 'I', request.user, pk):
-        return HttpResponseForbidden()
     invites = Invite.objects.filter(team_id=pk, status='P').values('invited__first_name', 'invited__last_name', 'invited__email', 'invited__pk', 'created_at', 'status', 'pk', 'created_by__first_name', 'created_by__last_name', 'created_by__email', 'created_by__pk')
     return render(request, 'invites.html', {'invites': invites, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
+@perm_required(('R', 'JR'))
 def join_requests(request, pk):
-    if not has_perm('R', 'JR', request.user, pk):
-        return HttpResponseForbidden()
     requests = JoinRequest.objects.filter(team_id=pk, status='P').values('user_id__first_name', 'user_id__last_name', 'user_id__username', 'user_id__pk', 'created_at', 'status', 'pk')
     return render(request, 'join_requests.html', {'requests': requests, 'console': get_console_data(pk, request.user)})
 
 @login_required(login_url='user:signin')
 def accept_invite(request, pk):
     if request.method == 'POST':
-        invite = Invite.objects.get(pk=pk)
+        # Invites and requests of a deleted team wait for the purge but can
+        # no longer be answered.
+        invite = get_object_or_404(Invite, pk=pk, team_id__deleted_at__isnull=True)
         if not has_perm('U', 'I', request.user, invite.team_id.id):
             return HttpResponseForbidden()
         invite.status = 'A'
@@ -107,7 +130,7 @@ def accept_invite(request, pk):
 @login_required(login_url='user:signin')
 def accept_join_request(request, pk):
     if request.method == 'POST':
-        join_request = JoinRequest.objects.get(pk=pk)
+        join_request = get_object_or_404(JoinRequest, pk=pk, team_id__deleted_at__isnull=True)
         if not has_perm('U', 'JR', request.user, join_request.team_id.id):
             return HttpResponseForbidden()
         join_request.status = 'A'
@@ -123,7 +146,7 @@ def accept_join_request(request, pk):
 @login_required(login_url='user:signin')
 def decline_invite(request, pk):
     if request.method == 'POST':
-        invite = Invite.objects.get(pk=pk)
+        invite = get_object_or_404(Invite, pk=pk, team_id__deleted_at__isnull=True)
         if not has_perm('U', 'I', request.user, invite.team_id.id):
             return HttpResponseForbidden()
         invite.status = 'R'
@@ -133,7 +156,7 @@ def decline_invite(request, pk):
 @login_required(login_url='user:signin')
 def decline_join_request(request, pk):
     if request.method == 'POST':
-        join_request = JoinRequest.objects.get(pk=pk)
+        join_request = get_object_or_404(JoinRequest, pk=pk, team_id__deleted_at__isnull=True)
         if not has_perm('U', 'JR', request.user, join_request.team_id.id):
             return HttpResponseForbidden()
         join_request.status = 'R'
@@ -155,8 +178,19 @@ def permissions(request, pk):
 
 @login_required(login_url='user:signin')
 def delete_team(request, pk):
-    team = Team.objects.get(id=pk)
+    team = get_object_or_404(Team.objects.live(), id=pk)
     if not has_perm('D', 'T', request.user, pk):
         return HttpResponseForbidden()
-    team.delete()
-    return redirect('user:dashboard', u_pk=request.user.pk)
\ No newline at end of file
+    # Hidden at once; the rows are purged in the background (team/purge.py).
+    deletion = mark_deleted(team, request.user)
+    start_purge(deletion)
+    return redirect('team:deletion', d_pk=deletion.pk)
+
+@login_required(login_url='user:signin')
+def deletion(request, d_pk):
+    deletion = get_object_or_404(TeamDeletion, pk=d_pk)
+    if deletion.requested_by_id != request.user.pk and not request.user.is_superuser:
+        return HttpResponseForbidden()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'name': deletion.name, 'total': deletion.total, 'purged': deletion.purged, 'percent': deletion.percent, 'finished': bool(deletion.finished_at)})
+    return render(request, 'team_deletion.html', {'deletion': deletion})
\ No newline at end of file
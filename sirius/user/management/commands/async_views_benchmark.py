@@ -0,0 +1,90 @@
+import asyncio
+import statistics
+import time
+from importlib import import_module
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from session.views import user_bulletin, user_bulletin_async, user_calendar, user_calendar_async, user_calendar_events, user_calendar_events_async
+from user.views import dashboard, dashboard_async
+
+# Latency of the sync and async per-user views under concurrent requests,
+# the way an ASGI server runs them: sync views one at a time on Django's
+# single sync thread, async views on the event loop with their reads in
+# worker threads. --db-latency adds a delay to every query to model a
+# database across the network (SQLite on local disk answers in microseconds).
+
+
+class Command(BaseCommand):
+    help = 'Compare latency of the sync and async dashboard, calendar and bulletin views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='User the requests are made as.')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--db-latency', type=float, default=2.0, help='Milliseconds added to every query.')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options['email']).first()
+        if not user:
+            raise CommandError(f'No user with email {options["email"]}')
+        delay = options['db_latency'] / 1000
+
+        def slow(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_delay(sender, connection, **kwargs):
+            # Fired on every reconnect of the same thread's connection object.
+            if slow not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow)
+        if delay:
+            connection_created.connect(add_delay, weak=False)
+            connection.execute_wrappers.append(slow)
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        factory = RequestFactory()
+        pages = (
+            ('dashboard', f'/user/{user.pk}/dashboard/', dashboard, dashboard_async, {'u_pk': user.pk}),
+            ('calendar', f'/user/{user.pk}/calendar/', user_calendar, user_calendar_async, {'u_pk': user.pk}),
+            ('calendar events', f'/user/{user.pk}/calendar/events/?start=2022-01-01&end=2022-02-01', user_calendar_events, user_calendar_events_async, {'u_pk': user.pk}),
+            ('bulletin', '/user/bulletin/', user_bulletin, user_bulletin_async, {}),
+        )
+
+        def request_for(path):
+            request = factory.get(path)
+            request.user = user
+            request.session = session
+            return request
+
+        async def measure(view, path, kwargs, is_async):
+            limit = asyncio.Semaphore(options['concurrency'])
+            # Django's ASGI handler runs sync views with thread_sensitive=True.
+            call = view if is_async else sync_to_async(view)
+
+            async def one():
+                async with limit:
+                    start = time.perf_counter()
+                    response = await call(request_for(path), **kwargs)
+                    assert response.status_code == 200, response.status_code
+                    return time.perf_counter() - start
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(one() for _ in range(options['requests'])))
+            return latencies, time.perf_counter() - start
+
+        self.stdout.write(f'{options["requests"]} requests, concurrency {options["concurrency"]}, +{options["db_latency"]} ms per query')
+        for name, path, sync_view, async_view, kwargs in pages:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, view, is_async in (('sync', sync_view, False), ('async', async_view, True)):
+                latencies, total = asyncio.run(measure(view, path, kwargs, is_async))
+                latencies = sorted(latencies)
+                self.stdout.write(
+                    f'  {label:5}  mean {statistics.mean(latencies) * 1000:7.1f} ms'
+                    f'  p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms'
+                    f'  p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms'
+                    f'  {options["requests"] / total:6.0f} req/s'
+                )
@@ -40,6 +40,9 @@ class CustomUser(AbstractUser):
     gender = models.CharField(_('gender'), max_length=2, choices=GENDER_CHOICES)
     email = models.EmailField(_('email address'), unique=True)
     is_superuser = models.BooleanField(_('superuser status'),default=False)
+    # Part of every calendar feed token (session/ical.py); bumped to revoke
+    # all of the user's feed links at once.
+    feed_generation = models.PositiveIntegerField(default=0, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
     objects = CustomUserManager()
@@ -1,18 +1,26 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
 from . import views
-from session.views import user_calendar, user_bulletin
+from session.views import user_calendar, user_calendar_events, user_calendar_feed, user_bulletin, search_sessions, reset_feed_token
+from session.views import user_calendar_async, user_calendar_events_async, user_bulletin_async
 
 app_name = 'user'
 
+ASYNC_VIEWS = settings.ASYNC_VIEWS
+
 urlpatterns = [
     path('signup/', views.signup, name='signup'),
     path('settings/', views.accountsettings, name='settings'),
     path('signin/', views.signin, name='signin'),
     path('signout/', views.signout, name='signout'),
-    path('bulletin/', user_bulletin, name='bulletin'),
-    path('<u_pk>/dashboard/', views.dashboard, name='dashboard'),
-    path('<u_pk>/calendar/', user_calendar, name='calendar'),
+    path('bulletin/', user_bulletin_async if ASYNC_VIEWS else user_bulletin, name='bulletin'),
+    path('search/', search_sessions, name='search'),
+    path('calendar/reset-feed/', reset_feed_token, name='reset_feed_token'),
+    path('<u_pk>/dashboard/', views.dashboard_async if ASYNC_VIEWS else views.dashboard, name='dashboard'),
+    path('<u_pk>/calendar/', user_calendar_async if ASYNC_VIEWS else user_calendar, name='calendar'),
+    path('<u_pk>/calendar/events/', user_calendar_events_async if ASYNC_VIEWS else user_calendar_events, name='calendar_events'),
+    path('<u_pk>/calendar.ics', user_calendar_feed, name='calendar_feed'),
     # path('<u_pk>/settings/', views.settings, name='settings'),
 ]
\ No newline at end of file
@@ -2,11 +2,14 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from asgiref.sync import sync_to_async
 
 from .forms import AccountAuthenticationForm, AccountSignupForm, ResetPasswordForm
 from authorization.models import Membership
 from team.models import JoinRequest
 from team.forms import JoinRequestForm
+from sirius.utils.concurrent import async_login_required, gather_reads
+from session.utils import unread_notice_counts
 
 def signup(request):
     if request.user.is_authenticated:
@@ -68,8 +71,12 @@ def signout(request):
 @login_required(login_url='user:signin')
 def dashboard(request, u_pk):
     user = get_user_model().objects.values('email', 'first_name', 'last_name').get(pk=u_pk)
-    teams = Membership.objects.filter(user_id=u_pk).values('created_at', 'alumni', 'team_id__id', 'team_id__name', 'role_id__pk', 'role_id__role_name')
-    join_requests = JoinRequest.objects.filter(user_id=u_pk)
+    teams = list(Membership.objects.filter(user_id=u_pk, team_id__deleted_at__isnull=True).values('created_at', 'alumni', 'team_id__id', 'team_id__name', 'role_id__pk', 'role_id__role_name'))
+    # Unread counts are the viewer's own, so only shown on their dashboard.
+    unread = unread_notice_counts(request.user) if str(request.user.pk) == u_pk else {}
+    for team in teams:
+        team['unread'] = unread.get(team['team_id__id'], 0)
+    join_requests = JoinRequest.objects.filter(user_id=u_pk, team_id__deleted_at__isnull=True).select_related('team_id')
     join_form = JoinRequestForm()
     join_form_errors = request.session.get('join_form_errors')
     if join_form_errors:
@@ -83,6 +90,30 @@ def dashboard(request, u_pk):
         'join_form': join_form
     })
 
+@async_login_required(login_url='user:signin')
+async def dashboard_async(request, u_pk):
+    # Same page as dashboard, with the reads run concurrently (see
+    # sirius.utils.concurrent); routed instead of it when settings.ASYNC_VIEWS.
+    user, teams, unread, join_requests, join_form_errors = await gather_reads(
+        lambda: get_user_model().objects.values('email', 'first_name', 'last_name').get(pk=u_pk),
+        lambda: list(Membership.objects.filter(user_id=u_pk, team_id__deleted_at__isnull=True).values('created_at', 'alumni', 'team_id__id', 'team_id__name', 'role_id__pk', 'role_id__role_name')),
+        lambda: unread_notice_counts(request.user) if str(request.user.pk) == u_pk else {},
+        lambda: list(JoinRequest.objects.filter(user_id=u_pk, team_id__deleted_at__isnull=True).select_related('team_id')),
+        lambda: request.session.pop('join_form_errors', None),
+    )
+    for team in teams:
+        team['unread'] = unread.get(team['team_id__id'], 0)
+    join_form = JoinRequestForm()
+    if join_form_errors:
+        for field, err in join_form_errors.items():
+            join_form.errors[field] = err
+    return await sync_to_async(render)(request, 'dashboard.html', {
+        'user': user,
+        'teams': teams,
+        'join_requests': join_requests,
+        'join_form': join_form
+    })
+
 @login_required(login_url='user:signin')
 def accountsettings(request):
     if request.method == 'POST':